@@ -0,0 +1,181 @@
+import os
+import threading
+
+import firebase_admin
+import google.generativeai as genai
+from dotenv import load_dotenv
+from firebase_admin import credentials, firestore
+from google.api_core import exceptions as google_exceptions
+from PIL import UnidentifiedImageError
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+from batch_scan import GEMINI_CONCURRENCY
+from ecode_cache import EcodeCache
+from ecode_index import INDEX_PATH
+from gemini_scheduler import GEMINI_RPM, GeminiScheduler
+from image_prep import MAX_EDGE
+from metrics import METRICS
+from ingredient_parser import parse_ingredient_text
+from scan_cache import ScanCache
+from scanner import CODE_INDEX, MODEL_NAME, SORT_PRIORITY, check_ingredients, normalize_code, safety_score, scan_label
+from verdict_cache import VerdictCache
+
+MAX_UPLOAD_BYTES = 15 * 1024 * 1024
+
+# --- HEADLESS SCAN API ---
+# JSON endpoints for mobile clients and partner integrations, with no page
+# rendering. Shares the scanner pipeline with app.py and batch_scan.py:
+#
+#   POST /scan          raw image bytes as the body (Content-Type: image/*)
+#   POST /check         {"ingredients": [{"code", "context"}]} or {"text": "..."}
+#   GET  /ecode/{code}  one database record, e.g. /ecode/E471
+#   GET  /metrics       per-stage latency histograms and counters (Prometheus)
+#
+#   uvicorn api:app --host 0.0.0.0 --port 8000 --workers 2
+
+
+# Clients are created once per worker process, on first use
+class Services:
+    def __init__(self):
+        load_dotenv()
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        self.model = GeminiScheduler(genai.GenerativeModel(MODEL_NAME),
+                                     rpm=int(os.getenv("HALAI_GEMINI_RPM", GEMINI_RPM)))
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(credentials.Certificate(os.getenv("HALAI_FIREBASE_KEY", "firebase_key.json")))
+        self.ecode_cache = EcodeCache(firestore.client(), index_path=INDEX_PATH)
+        self.scan_cache = ScanCache(disk_dir=os.getenv("HALAI_SCAN_CACHE_DIR"))
+        self.verdict_cache = VerdictCache(lambda: self.ecode_cache.version)
+        self.gemini_slots = threading.BoundedSemaphore(int(os.getenv("HALAI_GEMINI_CONCURRENCY", GEMINI_CONCURRENCY)))
+        self.max_edge = int(os.getenv("HALAI_MAX_EDGE", MAX_EDGE))
+
+
+_services = None
+_services_lock = threading.Lock()
+
+
+def get_services():
+    global _services
+    if _services is None:
+        with _services_lock:
+            if _services is None:
+                _services = Services()
+    return _services
+
+
+def error(message, status_code):
+    return JSONResponse({"error": message}, status_code=status_code)
+
+
+def verdict(status, details, detected=None):
+    body = {"status": status, "score": safety_score(details), "details": details}
+    if detected is not None:
+        body["detected"] = detected
+    return body
+
+
+async def scan(request):
+    image_bytes = await request.body()
+    if not image_bytes:
+        return error("Send the label photo as the request body.", 400)
+    if len(image_bytes) > MAX_UPLOAD_BYTES:
+        return error(f"Image is larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.", 413)
+
+    services = get_services()
+    try:
+        # Preprocessing, Gemini and Firestore all block, so they run off the event loop
+        detected, status, details = await run_in_threadpool(
+            scan_label, image_bytes, services.model, services.ecode_cache.get_many,
+            services.scan_cache, services.gemini_slots, services.max_edge, services.verdict_cache)
+    except UnidentifiedImageError:
+        return error("Body is not a readable image.", 400)
+    except google_exceptions.ResourceExhausted:
+        return error("Daily AI quota reached. Try again later or use POST /check.", 429)
+    except Exception as e:
+        return error(f"AI Error: {e}", 502)
+    return JSONResponse(verdict(status, details, detected))
+
+
+# {"code", "context"} items with both fields as strings; numeric codes (471)
+# are accepted and a missing or null context is empty. Raises ValueError
+# naming the first bad item.
+def clean_ingredients(items):
+    cleaned = []
+    for n, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise ValueError(f"ingredients[{n}] must be an object.")
+        code, context = item.get("code"), item.get("context")
+        if isinstance(code, int) and not isinstance(code, bool):
+            code = str(code)
+        if not isinstance(code, str):
+            raise ValueError(f"ingredients[{n}].code must be a string.")
+        if context is None:
+            context = ""
+        if not isinstance(context, str):
+            raise ValueError(f"ingredients[{n}].context must be a string.")
+        cleaned.append({"code": code, "context": context})
+    return cleaned
+
+
+# keys() loads the whole collection when there is no local index, so this
+# runs in the threadpool
+def parse_text(services, text):
+    known_keys = (services.ecode_cache.keys() or set()) | CODE_INDEX.keys()
+    return parse_ingredient_text(text, known_keys)
+
+
+async def check(request):
+    try:
+        payload = await request.json()
+    except ValueError:
+        return error("Body must be JSON.", 400)
+    if not isinstance(payload, dict):
+        return error('Expected {"ingredients": [...]} or {"text": "..."}.', 400)
+
+    services = get_services()
+    if isinstance(payload.get("text"), str):
+        ingredients = await run_in_threadpool(parse_text, services, payload["text"])
+    elif isinstance(payload.get("ingredients"), list):
+        try:
+            ingredients = clean_ingredients(payload["ingredients"])
+        except ValueError as e:
+            return error(str(e), 400)
+    else:
+        return error('Expected {"ingredients": [...]} or {"text": "..."}.', 400)
+
+    status, details = await run_in_threadpool(check_ingredients, ingredients, services.ecode_cache.get_many,
+                                              services.verdict_cache)
+    details.sort(key=lambda x: SORT_PRIORITY.get(x["status"], 5))
+    return JSONResponse(verdict(status, details, ingredients))
+
+
+async def ecode(request):
+    code = request.path_params["code"]
+    code_key = normalize_code(code)
+    if code_key is None:
+        return error(f"'{code}' is not an ingredient code.", 404)
+
+    data = await run_in_threadpool(get_services().ecode_cache.get, code_key)
+    if data is None:
+        return error(f"{code_key} is not in the database yet.", 404)
+    return JSONResponse({"key": code_key, **data})
+
+
+async def metrics(request):
+    return PlainTextResponse(METRICS.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+app = Starlette(routes=[
+    Route("/scan", scan, methods=["POST"]),
+    Route("/check", check, methods=["POST"]),
+    Route("/ecode/{code}", ecode, methods=["GET"]),
+    Route("/metrics", metrics, methods=["GET"]),
+])
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=os.getenv("HALAI_API_HOST", "127.0.0.1"), port=int(os.getenv("HALAI_API_PORT", 8000)))
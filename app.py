@@ -1,57 +1,184 @@
 import streamlit as st
-import google.generativeai as genai
-import firebase_admin
-from firebase_admin import credentials, firestore
 from dotenv import load_dotenv
-from PIL import Image
 import os
-import json
 import base64
-from google.api_core import exceptions as google_exceptions
 import urllib.parse
+import time
+import io
+import threading
+import uuid
+from ecode_cache import EcodeCache
+from ecode_index import INDEX_PATH
+from scan_cache import ScanCache
+from verdict_cache import VerdictCache
+from product_registry import HASH_BITS, ProductRegistry, dhash
+from extraction_cascade import MIN_CONFIDENCE, ExtractionCascade
+from session_store import IDLE_TIMEOUT, MAX_TOTAL_BYTES, SessionStore, compact_results, expand_results
+from report_writer import ReportWriter
+from metrics import METRICS
+from card_renderer import PAGE_SIZE, breakdown_html, icon, ingredient_card_html, page_count
+from scanner import (CODE_INDEX, MODEL_NAME, PROMPT_VERSION, SORT_PRIORITY, check_ingredients, collect_entries, combine_status,
+                     evaluate_ingredient, extract_ingredients, resolve_entries, safety_score, scan_panels,
+                     stream_ingredients)
+from image_prep import MAX_EDGE, decode_image, prepare_image, preview_jpeg
+from ingredient_parser import parse_ingredient_text
+from batch_scan import GEMINI_CONCURRENCY, BatchScanner, ResultWriter
+from gemini_scheduler import GEMINI_RPM, GeminiScheduler
 
 # --- 1. CONFIGURATION ---
+script_started = time.perf_counter()
 load_dotenv()
 st.set_page_config(page_title="HALAI™", page_icon="☪️", layout="wide")
 
 # Setup Gemini AI
-try:
-    gemini_key = st.secrets.get("GEMINI_API_KEY")
-except FileNotFoundError:
-    gemini_key = None
+# Clients are built once per process and reused by every rerun and session.
+# The SDKs are imported here rather than at the top so the first page paints
+# before they load; warm_up_clients() pre-imports them in the background.
+# One scheduler per process, so every session draws from the same quota
+@st.cache_resource
+def get_gemini_scheduler():
+    import google.generativeai as genai
 
-if not gemini_key:
-    gemini_key = os.getenv("GEMINI_API_KEY")
+    try:
+        gemini_key = st.secrets.get("GEMINI_API_KEY")
+    except FileNotFoundError:
+        gemini_key = None
+
+    if not gemini_key:
+        gemini_key = os.getenv("GEMINI_API_KEY")
+
+    genai.configure(api_key=gemini_key)
+    return GeminiScheduler(genai.GenerativeModel(MODEL_NAME), rpm=int(os.getenv("HALAI_GEMINI_RPM", GEMINI_RPM)))
 
-genai.configure(api_key=gemini_key)
-model = genai.GenerativeModel('gemini-2.5-flash-lite')
 
 # Setup Firebase
-if not firebase_admin._apps:
-    try:
-        if "firebase" in st.secrets:
-            firebase_conf = dict(st.secrets["firebase"])
-            if "private_key" in firebase_conf:
-                pkey = firebase_conf["private_key"].replace("\\n", "\n").strip('"').strip("'").strip()
-                if "@" in pkey:
-                    st.error("CONFIG ERROR: Your 'private_key' in Secrets contains an '@' symbol.")
-                    st.stop()
-                firebase_conf["private_key"] = pkey
-            cred = credentials.Certificate(firebase_conf)
+@st.cache_resource
+def get_firestore():
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    if not firebase_admin._apps:
+        try:
+            if "firebase" in st.secrets:
+                firebase_conf = dict(st.secrets["firebase"])
+                if "private_key" in firebase_conf:
+                    pkey = firebase_conf["private_key"].replace("\\n", "\n").strip('"').strip("'").strip()
+                    if "@" in pkey:
+                        st.error("CONFIG ERROR: Your 'private_key' in Secrets contains an '@' symbol.")
+                        st.stop()
+                    firebase_conf["private_key"] = pkey
+                cred = credentials.Certificate(firebase_conf)
+                firebase_admin.initialize_app(cred)
+        except FileNotFoundError:
+            pass
+
+        if not firebase_admin._apps and os.path.exists("firebase_key.json"):
+            cred = credentials.Certificate("firebase_key.json")
             firebase_admin.initialize_app(cred)
-    except FileNotFoundError:
-        pass
 
-    if not firebase_admin._apps and os.path.exists("firebase_key.json"):
-        cred = credentials.Certificate("firebase_key.json")
-        firebase_admin.initialize_app(cred)
+        if not firebase_admin._apps:
+            st.error("Firebase credentials not found.")
+    return firestore.client()
 
-    if not firebase_admin._apps:
-        st.error("Firebase credentials not found.")
-db = firestore.client()
+
+# Shared by every session in this process; see ecode_cache.py
+@st.cache_resource
+def get_ecode_cache():
+    return EcodeCache(get_firestore(), index_path=INDEX_PATH)
+
+
+# One background writer per process; the spool file keeps unsent reports
+@st.cache_resource
+def get_report_writer():
+    return ReportWriter(get_firestore(), spool_path=os.getenv("HALAI_REPORT_SPOOL", "reports_spool.jsonl"))
+
+
+# Longest image side sent to Gemini; see image_prep.py
+max_edge = int(os.getenv("HALAI_MAX_EDGE", MAX_EDGE))
+
+
+# Gemini results by image hash; set HALAI_SCAN_CACHE_DIR to keep them on disk
+@st.cache_resource
+def get_scan_cache():
+    return ScanCache(disk_dir=os.getenv("HALAI_SCAN_CACHE_DIR"))
+
+scan_cache = get_scan_cache()
+
+
+# Finished verdicts by ingredient set, shared by every session; see verdict_cache.py
+@st.cache_resource
+def get_verdict_cache():
+    return VerdictCache(lambda: get_ecode_cache().version)
+
+verdict_cache = get_verdict_cache()
+
+
+# Verdicts by perceptual hash of the label photo, shared by every session; see product_registry.py.
+# Off unless HALAI_PRODUCT_REGISTRY is set: a hit needs a local read that
+# try_local would accept anyway, so for now it saves no Gemini call.
+PRODUCT_REGISTRY = bool(os.getenv("HALAI_PRODUCT_REGISTRY"))
+
+
+@st.cache_resource
+def get_product_registry():
+    return ProductRegistry(lambda: get_ecode_cache().version)
+
+product_registry = get_product_registry()
+
+
+# Local OCR tried before Gemini on every photo scan; see extraction_cascade.py.
+# HALAI_LOCAL_MIN_CONFIDENCE trades quota savings against accuracy.
+@st.cache_resource
+def get_extraction_cascade():
+    def known_keys():
+        keys = get_ecode_cache().keys()
+        return keys | CODE_INDEX.keys() if keys is not None else None
+    return ExtractionCascade(known_keys, min_confidence=float(os.getenv("HALAI_LOCAL_MIN_CONFIDENCE", MIN_CONFIDENCE)))
+
+extraction_cascade = get_extraction_cascade()
+
+
+# Results, previews and batch output of every session, with a byte budget
+# each, a cap on the total and idle sessions dropped; see session_store.py
+@st.cache_resource
+def get_session_store():
+    return SessionStore(idle_timeout=int(os.getenv("HALAI_SESSION_IDLE_SECONDS", IDLE_TIMEOUT)),
+                        max_bytes=int(os.getenv("HALAI_SESSION_MAX_BYTES", MAX_TOTAL_BYTES)))
+
+session_store = get_session_store()
+session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+session_expired = session_store.touch(session_id)
+
+
+# Caps simultaneous Gemini calls from batch scans across all sessions
+@st.cache_resource
+def get_gemini_slots():
+    return threading.BoundedSemaphore(int(os.getenv("HALAI_GEMINI_CONCURRENCY", GEMINI_CONCURRENCY)))
+
+gemini_slots = get_gemini_slots()
+
+
+# Imports the SDKs in the background once the page is up, so the imports
+# overlap with the user choosing a photo. Only imports: the clients and the
+# E-code load are built by the cached builders, which must run in the
+# script thread, so the first scan still pays for those.
+def warm_up_clients():
+    try:
+        import google.generativeai  # noqa: F401
+        from firebase_admin import firestore  # noqa: F401
+    except Exception:
+        pass  # the first scan imports them again and shows the error
+
+
+@st.cache_resource
+def start_warm_up():
+    thread = threading.Thread(target=warm_up_clients, name="halai-warm-up", daemon=True)
+    thread.start()
+    return thread
 
 
 # --- LOGO HELPER ---
+@st.cache_data
 def get_logo_base64(path="logohalai.jpg"):
     if os.path.exists(path):
         with open(path, "rb") as f:
@@ -64,134 +191,145 @@ def get_logo_base64(path="logohalai.jpg"):
 LOGO_SRC = get_logo_base64("logohalai.jpg")
 
 
-# --- SVG ICON HELPER ---
-def icon(name, size=16, color="currentColor"):
-    paths = {
-        "smartphone":     '<rect x="5" y="2" width="14" height="20" rx="2" ry="2"/><line x1="12" y1="18" x2="12.01" y2="18"/>',
-        "shield":         '<path d="M12 22s8-4 8-10V5l-8-3-8 3v7c0 6 8 10 8 10z"/>',
-        "upload-cloud":   '<polyline points="16 16 12 12 8 16"/><line x1="12" y1="12" x2="12" y2="21"/><path d="M20.39 18.39A5 5 0 0 0 18 9h-1.26A8 8 0 1 0 3 16.3"/>',
-        "scan":           '<path d="M3 7V5a2 2 0 0 1 2-2h2"/><path d="M17 3h2a2 2 0 0 1 2 2v2"/><path d="M21 17v2a2 2 0 0 1-2 2h-2"/><path d="M7 21H5a2 2 0 0 1-2-2v-2"/><line x1="7" y1="12" x2="17" y2="12"/>',
-        "bar-chart":      '<line x1="12" y1="20" x2="12" y2="10"/><line x1="18" y1="20" x2="18" y2="4"/><line x1="6" y1="20" x2="6" y2="16"/>',
-        "share-2":        '<circle cx="18" cy="5" r="3"/><circle cx="6" cy="12" r="3"/><circle cx="18" cy="19" r="3"/><line x1="8.59" y1="13.51" x2="15.42" y2="17.49"/><line x1="15.41" y1="6.51" x2="8.59" y2="10.49"/>',
-        "list":           '<line x1="8" y1="6" x2="21" y2="6"/><line x1="8" y1="12" x2="21" y2="12"/><line x1="8" y1="18" x2="21" y2="18"/><line x1="3" y1="6" x2="3.01" y2="6"/><line x1="3" y1="12" x2="3.01" y2="12"/><line x1="3" y1="18" x2="3.01" y2="18"/>',
-        "flag":           '<path d="M4 15s1-1 4-1 5 2 8 2 4-1 4-1V3s-1 1-4 1-5-2-8-2-4 1-4 1z"/><line x1="4" y1="22" x2="4" y2="15"/>',
-        "send":           '<line x1="22" y1="2" x2="11" y2="13"/><polygon points="22 2 15 22 11 13 2 9 22 2"/>',
-        "info":           '<circle cx="12" cy="12" r="10"/><line x1="12" y1="16" x2="12" y2="12"/><line x1="12" y1="8" x2="12.01" y2="8"/>',
-        "zap":            '<polygon points="13 2 3 14 12 14 11 22 21 10 12 10 13 2"/>',
-        "x-circle":       '<circle cx="12" cy="12" r="10"/><line x1="15" y1="9" x2="9" y2="15"/><line x1="9" y1="9" x2="15" y2="15"/>',
-        "alert-triangle": '<path d="M10.29 3.86L1.82 18a2 2 0 0 0 1.71 3h16.94a2 2 0 0 0 1.71-3L13.71 3.86a2 2 0 0 0-3.42 0z"/><line x1="12" y1="9" x2="12" y2="13"/><line x1="12" y1="17" x2="12.01" y2="17"/>',
-        "check-circle":   '<path d="M22 11.08V12a10 10 0 1 1-5.93-9.14"/><polyline points="22 4 12 14.01 9 11.01"/>',
-        "check":          '<polyline points="20 6 9 16 4 11"/>',
-        "minus-circle":   '<circle cx="12" cy="12" r="10"/><line x1="8" y1="12" x2="16" y2="12"/>',
-        "menu":           '<line x1="3" y1="12" x2="21" y2="12"/><line x1="3" y1="6" x2="21" y2="6"/><line x1="3" y1="18" x2="21" y2="18"/>',
-    }
-    inner = paths.get(name, "")
-    return (
-        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
-        f'viewBox="0 0 24 24" fill="none" stroke="{color}" '
-        f'stroke-width="1.75" stroke-linecap="round" stroke-linejoin="round" '
-        f'style="display:inline-block;vertical-align:middle;flex-shrink:0">'
-        f'{inner}</svg>'
-    )
-
-
-# --- SAFE TEXT HELPER ---
-# Strips ALL HTML from AI-generated text so it never breaks card rendering
-def safe_text(text):
-    return (str(text)
-            .replace("&", "&amp;")
-            .replace("<", "&lt;")
-            .replace(">", "&gt;")
-            .replace('"', "&quot;")
-            .replace("'", "&#39;"))
+# --- 2. CORE FUNCTIONS ---
 
+# Send a rotated, downscaled JPEG instead of the raw photo
+def prepare_for_gemini(image, image_bytes=None):
+    with METRICS.span("preprocess"):
+        blob, _, prep_stats = prepare_image(image, len(image_bytes) if image_bytes else None, max_edge=max_edge)
+    if (prep_stats["saved_bytes"] or 0) > 0:
+        st.toast(f"Optimized upload: {prep_stats['original_bytes'] // 1024} KB → {prep_stats['prepared_bytes'] // 1024} KB")
+    return blob
+
+
+# read: the scan's extraction_cascade.reader(), so the photo is OCR'd once
+def analyze_image(image, image_bytes=None, read=None):
+    cache_key = None
+    if image_bytes is not None:
+        cache_key = ScanCache.make_key(image_bytes, PROMPT_VERSION)
+        cached = scan_cache.get(cache_key)
+        if cached is not None:
+            METRICS.inc("scan_cache_hits")
+            return cached
+
+    # Tier 1: a cleanly printed list is read locally, with no Gemini call
+    detected = extraction_cascade.try_local(image, read)
+    if detected is not None:
+        if cache_key is not None:
+            scan_cache.put(cache_key, detected)
+        return detected
+
+    from google.api_core import exceptions as google_exceptions
+    try:
+        blob = prepare_for_gemini(image, image_bytes)
+        with METRICS.span("gemini"):
+            detected = extract_ingredients(get_gemini_scheduler(), blob)
+        if cache_key is not None:
+            scan_cache.put(cache_key, detected)
+        return detected
+    except google_exceptions.ResourceExhausted:
+        METRICS.inc("scan_errors")
+        st.error("AI Quota Error: You've exceeded the free request limit for today.")
+        st.warning("Please wait for your quota to reset or enable billing on your Google Cloud project.")
+        return None
+    except Exception as e:
+        METRICS.inc("scan_errors")
+        st.error(f"AI Error: {e}")
+        return None
 
-# --- 2. CORE FUNCTIONS ---
 
-def analyze_image(image):
-    prompt = """
-    Analyze this food label image.
-    1. Identify ALL food additives, E-numbers (e.g., E120), INS numbers (e.g., INS 471), and suspicious ingredients (e.g., Gelatin, Lard, Emulsifiers).
-    2. If an ingredient is listed by name (e.g., "Citric Acid"), try to provide its E-number in the 'code' field (e.g., "E330").
-    3. Use context keywords (like "Vegetable", "Soy", "Animal") ONLY to fill the 'context' field. DO NOT list them as separate ingredients.
-    4. Return the result strictly as a JSON list of objects with keys: "code" (the E-number, INS number, or name) and "context" (the surrounding text indicating source).
-    5. Do not list the same ingredient twice.
-    6. Do not add markdown like ```json. Just the raw JSON.
-
-    Example Output: [{"code": "E471", "context": "Vegetable origin"}, {"code": "Gelatin", "context": ""}]
-    """
+# Several photos of one product in one Gemini request; returns (status,
+# details), or None if the AI call failed or found nothing
+def analyze_panels(panel_bytes, tile):
+    from google.api_core import exceptions as google_exceptions
     try:
-        response = model.generate_content([prompt, image])
-        text_output = response.text.replace("```json", "").replace("```", "").strip()
-        return json.loads(text_output)
+        detected, status, details = scan_panels(panel_bytes, get_gemini_scheduler(), get_ecode_cache().get_many,
+                                                scan_cache, max_edge=max_edge, verdict_cache=verdict_cache, tile=tile)
     except google_exceptions.ResourceExhausted:
+        METRICS.inc("scan_errors")
         st.error("AI Quota Error: You've exceeded the free request limit for today.")
         st.warning("Please wait for your quota to reset or enable billing on your Google Cloud project.")
         return None
     except Exception as e:
+        METRICS.inc("scan_errors")
         st.error(f"AI Error: {e}")
         return None
+    if not detected:
+        st.warning("No E-codes or ingredients detected. Try clearer photos.")
+        return None
+    return status, details
 
 
 def check_database(ingredients):
+    with METRICS.span("check_database"):
+        return check_ingredients(ingredients, get_ecode_cache().get_many, verdict_cache)
+
+
+# Streams Gemini output and checks each ingredient as soon as it is parsed.
+# on_result(result) is called per ingredient; returns (detected, status,
+# results_list), or None if the AI call failed.
+def scan_streaming(image, image_bytes, on_result, read=None):
+    cache_key = ScanCache.make_key(image_bytes, PROMPT_VERSION)
+    cached = scan_cache.get(cache_key)
+    detected = []
     results_list = []
     overall_status = "Halal"
     seen_codes = set()
-    ignore_keywords = {"VEGETABLE", "PLANT", "PLANTBASED", "SOY", "SYNTHETIC", "ANIMAL",
-                       "MINERAL", "FLAVOR", "COLOUR", "PRESERVATIVE", "INGREDIENTS", "CONTAINS"}
-
-    for item_obj in ingredients:
-        code_str = item_obj.get("code", "").strip()
-        context = item_obj.get("context", "").strip()
-        if not code_str:
-            continue
-
-        code_key = code_str.upper().replace("-", "").replace(" ", "").replace(".", "").replace("(", "").replace(")", "")
-        if code_key in ignore_keywords:
-            continue
-        if "INS" in code_key:
-            code_key = code_key.replace("INS", "E")
-        if code_key.isdigit():
-            code_key = f"E{code_key}"
-        if code_key in seen_codes:
-            continue
-        seen_codes.add(code_key)
-
-        doc_ref = db.collection('ecodes').document(code_key)
-        doc = doc_ref.get()
-
-        current_status = "Unknown"
-        description = "Not in database yet."
-        name = code_str
-
-        if doc.exists:
-            data = doc.to_dict()
-            name = data.get('name', name)
-            current_status = data.get('status', 'Unknown')
-            description = data.get('description', '')
-
-        if current_status != "Haram":
-            lower_context = context.lower()
-            lower_name = name.lower()
-            safe_keywords = ["vegetable", "plant", "soy", "synthetic", "mineral", "vegan",
-                             "polyol", "gum", "cocoa", "fiber", "vanilla", "amino", "bcaa", "fermentation"]
-            if any(k in lower_context for k in safe_keywords) or any(k in lower_name for k in safe_keywords):
-                if current_status in ["Syubhah", "Unknown"]:
-                    current_status = "Halal"
-                    if description == "Not in database yet.":
-                        description = "Verified as Safe by AI Context."
-                    elif "(Verified as Safe by AI Context)" not in description:
-                        description += " (Verified as Safe by AI Context)"
-
-        results_list.append({"code": code_str, "name": name, "status": current_status,
-                              "description": description, "context": context})
-
-        if current_status == 'Haram':
-            overall_status = "Haram"
-        elif current_status == 'Syubhah' and overall_status != "Haram":
-            overall_status = "Syubhah"
-
-    return overall_status, results_list
+    get_many = METRICS.timed("db_lookup", get_ecode_cache().get_many)
+
+    from google.api_core import exceptions as google_exceptions
+    try:
+        source = cached
+        if source is None:
+            source = extraction_cascade.try_local(image, read)
+        if source is None:
+            source = stream_ingredients(get_gemini_scheduler(), prepare_for_gemini(image, image_bytes))
+        for item_obj in source:
+            detected.append(item_obj)
+            for code_key, code_str, context in collect_entries([item_obj], seen_codes):
+                matches = {}
+                data = resolve_entries([(code_key, code_str, context)], get_many, matches)[code_key]
+                result = evaluate_ingredient(code_str, context, data, matches.get(code_key))
+                results_list.append(result)
+                overall_status = combine_status(overall_status, result["status"])
+                on_result(result)
+    except google_exceptions.ResourceExhausted:
+        METRICS.inc("scan_errors")
+        st.error("AI Quota Error: You've exceeded the free request limit for today.")
+        st.warning("Please wait for your quota to reset or enable billing on your Google Cloud project.")
+        return None
+    except Exception as e:
+        METRICS.inc("scan_errors")
+        st.error(f"AI Error: {e}")
+        return None
+
+    if cached is None:
+        scan_cache.put(cache_key, detected)
+    return detected, overall_status, results_list
+
+
+# Registers a finished photo scan; a rescan replaces the product it matched
+def remember_product(image_hash, detected, status, details, replaces=None):
+    if not PRODUCT_REGISTRY:
+        return
+    if replaces is not None:
+        product_registry.remove(replaces)
+    product_registry.add(image_hash, detected, status, details)
+
+
+# The verdict on screen lives in the session store, compacted
+def save_results(results):
+    session_store.set(session_id, "results", compact_results(results) if results else None)
+
+
+def load_results():
+    compact = session_store.get(session_id, "results")
+    return expand_results(compact) if compact else None
+
+
+# "Rescan anyway" callback: the next run scans the photo even though it matched
+def request_rescan(product_id):
+    st.session_state.rescan_of = product_id
 
 
 # --- 3. THE USER INTERFACE ---
@@ -373,9 +511,9 @@ html, body, [class*="css"] { font-family: 'DM Sans', sans-serif; }
 .verdict-body { font-size: 1.1rem; opacity: 0.95; line-height: 1.5; }
 
 /* ── Ingredient cards ──
-   NOTE: Each card section (header, context, desc) is rendered as a
-   SEPARATE st.markdown() call — this avoids mobile HTML rendering bugs
-   where multi-line f-strings with dynamic content get escaped.        ── */
+   NOTE: The whole breakdown is ONE st.markdown() call built by
+   card_renderer.py. Its HTML has no indentation and no blank lines —
+   either would make Markdown escape the rest of the block on mobile.  ── */
 .ing-card-wrap {
     background: rgba(255,252,245,0.9);
     border: 1px solid rgba(184,146,42,0.12);
@@ -400,6 +538,8 @@ html, body, [class*="css"] { font-family: 'DM Sans', sans-serif; }
 .ing-status.unknown { color: #9E8C72; }
 .ing-ctx  { font-size: 0.9rem; color: #A89070; font-style: italic; margin-top: 0.3rem; display: flex; align-items: center; gap: 5px; }
 .ing-desc { font-size: 1.0rem; color: #5C4A2A; margin-top: 0.3rem; line-height: 1.4; font-weight: 500; }
+.ing-more > summary { cursor: pointer; font-size: 0.95rem; font-weight: 600; color: #8B6914; padding: 0.4rem 0.2rem 0.7rem 0.2rem; }
+.ing-more[open] > summary { color: #9E8C72; }
 
 /* ── Placeholder ── */
 .placeholder-box { display: flex; flex-direction: column; align-items: center; justify-content: center; min-height: 220px; text-align: center; gap: 0.8rem; background: rgba(255,252,245,0.5); border: 2px dashed rgba(184,146,42,0.4); border-radius: 12px; padding: 2rem; }
@@ -520,64 +660,249 @@ st.markdown(f"""
 # ══════════════════════════════════════════════════════════════
 col1, col2 = st.columns([1, 1], gap="large")
 
+with col2:
+    st.markdown(f'<div class="section-label">{icon("bar-chart",24,"#8B6914")} &nbsp;Step 2 — Analysis Result</div>', unsafe_allow_html=True)
+    # Cards land here while a streaming scan is running
+    live_results = st.empty()
+
 with col1:
     st.markdown(f'<div class="section-label">{icon("upload-cloud",24,"#8B6914")} &nbsp;Step 1 — Upload Label</div>', unsafe_allow_html=True)
     
-    uploaded_file = st.file_uploader("Upload Label Image", type=["jpg", "png", "jpeg", "webp"], label_visibility="collapsed", key="file_uploader")
-
-    if uploaded_file is not None:
-        # Reset results if a new file is uploaded
-        file_id = f"{uploaded_file.name}-{uploaded_file.size}"
-        if "last_file_id" not in st.session_state or st.session_state.last_file_id != file_id:
-            st.session_state.last_file_id = file_id
-            st.session_state.results = None
-
-        try:
-            image = Image.open(uploaded_file)
-            st.image(image, caption="Uploaded Label", use_container_width=True)
-        except Exception:
-            st.error("Error loading image. Please try again.")
-            st.stop()
-
-        if st.button("Scan Ingredients", type="primary", use_container_width=True):
-            with st.spinner("AI is reading the label..."):
-                st.toast("Analyzing image...")
-                detected_ingredients = analyze_image(image)
-
-                if detected_ingredients is None:
-                    st.session_state.results = None
-                elif not detected_ingredients:
-                    st.warning("No E-codes or ingredients detected. Try a clearer photo.")
-                    st.session_state.results = None
+    scan_mode = st.radio("Scan mode", ["Photo", "Several photos", "Paste ingredients", "Batch"], horizontal=True,
+                         label_visibility="collapsed", key="scan_mode")
+    uploaded_file = None
+    has_input = False
+    if session_expired:
+        st.info("This page was idle for a while, so its last result was cleared. Scan again to see it.")
+
+    if scan_mode == "Paste ingredients":
+        pasted_text = st.text_area("Ingredient list", height=180, key="pasted_text",
+                                   placeholder="Ingredients: Sugar, Wheat Flour, Emulsifier (E471), Gelatin...")
+        has_input = bool(pasted_text.strip())
+
+        # Reset results if the pasted text changes
+        text_id = f"text-{hash(pasted_text)}"
+        if "last_file_id" not in st.session_state or st.session_state.last_file_id != text_id:
+            st.session_state.last_file_id = text_id
+            save_results(None)
+
+        if st.button("Check Ingredients", type="primary", use_container_width=True, disabled=not has_input):
+            # Parsed locally: no Gemini call, no quota
+            known_keys = get_ecode_cache().keys()
+            if known_keys is not None:
+                known_keys |= CODE_INDEX.keys()
+            detected_ingredients = parse_ingredient_text(pasted_text, known_keys)
+            if not detected_ingredients:
+                st.warning("No E-codes or known ingredients found in the text.")
+                save_results(None)
+            else:
+                status, details = check_database(detected_ingredients)
+                details.sort(key=lambda x: SORT_PRIORITY.get(x["status"], 5))
+                save_results({"status": status, "details": details})
+                st.toast("Scan complete!")
+    elif scan_mode == "Several photos":
+        # One product photographed panel by panel, e.g. a list that wraps around the pack
+        panel_files = st.file_uploader("Upload Label Panels", type=["jpg", "png", "jpeg", "webp"],
+                                       accept_multiple_files=True, label_visibility="collapsed", key="panel_uploader")
+        has_input = bool(panel_files)
+
+        panels_id = "panels-" + "|".join(f"{f.name}-{f.size}" for f in panel_files or [])
+        if "last_file_id" not in st.session_state or st.session_state.last_file_id != panels_id:
+            st.session_state.last_file_id = panels_id
+            save_results(None)
+
+        if panel_files:
+            previews = session_store.get(session_id, "panel_previews")
+            if previews is None or previews[0] != panels_id:
+                try:
+                    previews = (panels_id, [preview_jpeg(f, edge=220) for f in panel_files])
+                except Exception:
+                    st.error("Error loading image. Please try again.")
+                    st.stop()
+                session_store.set(session_id, "panel_previews", previews)
+            st.image(previews[1], width=110, caption=[f"Panel {i}" for i in range(1, len(panel_files) + 1)])
+            tile_panels = st.toggle("Combine into one image (faster, less detail)", value=False, key="tile_panels")
+
+            if st.button(f"Scan {len(panel_files)} Photos as One Product", type="primary", use_container_width=True):
+                with st.spinner("AI is reading the label..."), METRICS.span("analyze_panels"):
+                    verdict = analyze_panels([f.getvalue() for f in panel_files], tile_panels)
+                if verdict is None:
+                    save_results(None)
                 else:
-                    st.toast("Checking database...")
-                    status, details = check_database(detected_ingredients)
-                    sort_priority = {"Haram": 1, "Syubhah": 2, "Unknown": 3, "Halal": 4}
-                    details.sort(key=lambda x: sort_priority.get(x["status"], 5))
-                    st.session_state.results = {"status": status, "details": details}
+                    status, details = verdict
+                    save_results({"status": status, "details": details})
                     st.toast("Scan complete!")
+        else:
+            session_store.set(session_id, "panel_previews", None)
+    elif scan_mode == "Batch":
+        batch_files = st.file_uploader("Upload Label Images", type=["jpg", "png", "jpeg", "webp"],
+                                       accept_multiple_files=True, label_visibility="collapsed", key="batch_uploader")
+
+        if batch_files and st.button(f"Scan {len(batch_files)} Labels", type="primary", use_container_width=True):
+            progress = st.progress(0.0, text="Scanning labels...")
+            out = io.StringIO()
+            writer = ResultWriter(out, "jsonl")
+            rows = []
+
+            def on_record(record):
+                writer.write(record)
+                rows.append({"File": record["file"], "Status": record["status"] or "Error",
+                             "Score": record["score"], "Ingredients": len(record["details"]),
+                             "Error": record["error"] or ""})
+                progress.progress(len(rows) / len(batch_files), text=f"Scanned {len(rows)} of {len(batch_files)}")
+
+            batch = BatchScanner(get_gemini_scheduler(), get_ecode_cache().get_many, scan_cache,
+                                 gemini_slots=gemini_slots, max_edge=max_edge, verdict_cache=verdict_cache)
+            stats = batch.run([(f.name, f.getvalue) for f in batch_files], on_record)
+            progress.empty()
+            if not session_store.set(session_id, "batch_results", {"rows": rows, "jsonl": out.getvalue(), "stats": stats}):
+                st.warning("These results are too large to keep between page updates. Download them now.")
+                st.download_button("Download Verdicts (JSONL)", out.getvalue(), file_name="halai_verdicts.jsonl",
+                                   mime="application/jsonl", use_container_width=True)
+
+        batch_results = session_store.get(session_id, "batch_results") if batch_files else None
+        if batch_results:
+            stats = batch_results["stats"]
+            st.dataframe(batch_results["rows"], use_container_width=True, hide_index=True)
+            st.caption(f"{stats['images']} labels in {stats['seconds']}s · {stats['images_per_minute']} labels/minute")
+            st.download_button("Download Verdicts (JSONL)", batch_results["jsonl"], file_name="halai_verdicts.jsonl",
+                               mime="application/jsonl", use_container_width=True)
+        elif not batch_files:
+            session_store.set(session_id, "batch_results", None)
     else:
-        # Clear results if file is removed
-        st.session_state.results = None
+        uploaded_file = st.file_uploader("Upload Label Image", type=["jpg", "png", "jpeg", "webp"], label_visibility="collapsed", key="file_uploader")
+
+        if uploaded_file is not None:
+            has_input = True
+            # Reset results if a new file is uploaded
+            file_id = f"{uploaded_file.name}-{uploaded_file.size}"
+            if "last_file_id" not in st.session_state or st.session_state.last_file_id != file_id:
+                st.session_state.last_file_id = file_id
+                save_results(None)
+
+            # A small JPEG made once per upload, not the full photo decoded on every rerun
+            preview = session_store.get(session_id, "preview")
+            if preview is None or preview[0] != file_id:
+                try:
+                    with METRICS.span("preview"):
+                        preview = (file_id, preview_jpeg(uploaded_file))
+                except Exception:
+                    st.error("Error loading image. Please try again.")
+                    st.stop()
+                session_store.set(session_id, "preview", preview)
+            st.image(preview[1], caption="Uploaded Label", use_container_width=True)
+
+            stream_results = st.toggle("Show results as they are found", value=True)
+
+            rescan_of = st.session_state.pop("rescan_of", None)
+            if st.button("Scan Ingredients", type="primary", use_container_width=True) or rescan_of is not None:
+                # Decoded only for the scan, at a bounded size, and closed after it
+                try:
+                    with METRICS.span("image_decode"):
+                        image = decode_image(uploaded_file.getvalue())
+                except Exception:
+                    st.error("Error loading image. Please try again.")
+                    st.stop()
+                # One local read of the photo, shared by the registry check and the scan
+                local_read = extraction_cascade.reader(image)
+                image_hash = known = None
+                if PRODUCT_REGISTRY:
+                    # A photo of a product someone already scanned reuses its verdict
+                    with METRICS.span("product_hash"):
+                        image_hash = dhash(image)
+                    if rescan_of is None:
+                        # A similar-looking pack only counts if its text reads the same
+                        confirm = extraction_cascade.text_check(local_read, check_database)
+                        known = product_registry.lookup(image_hash, confirm)
+                if known is None:
+                    queue_wait = get_gemini_scheduler().estimated_wait()
+                    if queue_wait >= 1:
+                        st.info(f"High demand right now — your scan is queued and will start in about {queue_wait:.0f}s.")
+
+                if known is not None:
+                    METRICS.inc("product_registry_hits")
+                    if known["verdict"] is not None:
+                        status, details = known["verdict"]
+                    else:
+                        # E-code data changed since: re-check the stored ingredients
+                        status, details = check_database(known["detected"])
+                    details.sort(key=lambda x: SORT_PRIORITY.get(x["status"], 5))
+                    save_results({"status": status, "details": details,
+                                  "product_match": {"id": known["id"], "distance": known["distance"]}})
+                    METRICS.inc("scans")
+                    st.toast("Recognized this product from an earlier scan!")
+                elif stream_results:
+                    st.toast("Analyzing image...")
+                    live_box = live_results.container()
+                    started = time.perf_counter()
+                    first_result_at = []
+
+                    def show_card(result):
+                        if not first_result_at:
+                            first_result_at.append(time.perf_counter() - started)
+                            METRICS.observe("first_result", first_result_at[0])
+                        live_box.markdown(ingredient_card_html(result), unsafe_allow_html=True)
+
+                    with st.spinner("AI is reading the label..."), METRICS.span("scan_streaming"):
+                        scan = scan_streaming(image, uploaded_file.getvalue(), show_card, local_read)
+                    live_results.empty()
+
+                    if scan is None:
+                        save_results(None)
+                    elif not scan[0]:
+                        st.warning("No E-codes or ingredients detected. Try a clearer photo.")
+                        save_results(None)
+                    else:
+                        detected_ingredients, status, details = scan
+                        details.sort(key=lambda x: SORT_PRIORITY.get(x["status"], 5))
+                        save_results({"status": status, "details": details})
+                        remember_product(image_hash, detected_ingredients, status, details, rescan_of)
+                        METRICS.inc("scans")
+                        if first_result_at:
+                            st.toast(f"Scan complete! First result in {first_result_at[0]:.1f}s, "
+                                     f"all in {time.perf_counter() - started:.1f}s")
+                        else:
+                            st.toast("Scan complete!")
+                else:
+                    with st.spinner("AI is reading the label..."):
+                        st.toast("Analyzing image...")
+                        with METRICS.span("analyze_image"):
+                            detected_ingredients = analyze_image(image, uploaded_file.getvalue(), local_read)
+
+                        if detected_ingredients is None:
+                            save_results(None)
+                        elif not detected_ingredients:
+                            st.warning("No E-codes or ingredients detected. Try a clearer photo.")
+                            save_results(None)
+                        else:
+                            st.toast("Checking database...")
+                            status, details = check_database(detected_ingredients)
+                            details.sort(key=lambda x: SORT_PRIORITY.get(x["status"], 5))
+                            save_results({"status": status, "details": details})
+                            remember_product(image_hash, detected_ingredients, status, details, rescan_of)
+                            METRICS.inc("scans")
+                            st.toast("Scan complete!")
+                image.close()
+        else:
+            # Clear results if file is removed
+            save_results(None)
+            session_store.set(session_id, "preview", None)
         
-        st.markdown(f"""
-        <div class="placeholder-box">
-            <div>{icon("upload-cloud", 48, "#8B6914")}</div>
-            <div class="placeholder-text">Upload a photo or take a picture<br>to scan your food label</div>
-        </div>
-        """, unsafe_allow_html=True)
+            st.markdown(f"""
+            <div class="placeholder-box">
+                <div>{icon("upload-cloud", 48, "#8B6914")}</div>
+                <div class="placeholder-text">Upload a photo or take a picture<br>to scan your food label</div>
+            </div>
+            """, unsafe_allow_html=True)
 
 with col2:
-    st.markdown(f'<div class="section-label">{icon("bar-chart",24,"#8B6914")} &nbsp;Step 2 — Analysis Result</div>', unsafe_allow_html=True)
-
-    if "results" in st.session_state and st.session_state.results and uploaded_file:
-        results = st.session_state.results
+    results = load_results() if has_input else None
+    if results:
         status = results["status"]
         details = results["details"]
 
         total_items = len(details)
-        safe_items = sum(1 for i in details if i["status"] == "Halal")
-        score = int((safe_items / total_items) * 100) if total_items > 0 else 0
+        score = safety_score(details)
 
         m_col1, m_col2 = st.columns(2)
         m_col1.metric("Safety Score", f"{score}%")
@@ -604,6 +929,14 @@ with col2:
                 <div class="verdict-body">No flagged ingredients detected. This product <strong>appears safe</strong> to consume.</div>
             </div>""", unsafe_allow_html=True)
 
+        product_match = results.get("product_match")
+        if product_match:
+            similarity = 1 - product_match["distance"] / HASH_BITS
+            st.caption(f"Verdict reused from an earlier scan of a matching photo ({similarity:.0%} image match, "
+                       "same flagged ingredients read from this photo). "
+                       "Different product or a newer recipe? Scan it again.")
+            st.button("Rescan anyway", on_click=request_rescan, args=(product_match["id"],), use_container_width=True)
+
         st.markdown("<br>", unsafe_allow_html=True)
 
         share_text = f"☪️ *HALAI™ Scan Result*\n\nStatus: *{status}*\nSafety Score: {score}%\n\nCheck your food with HALAI!"
@@ -613,35 +946,15 @@ with col2:
         st.divider()
         st.markdown(f'<div class="section-label">{icon("list",13,"#B8922A")} &nbsp;Detailed Breakdown</div>', unsafe_allow_html=True)
 
-        # Status SVG map
-        status_svg = {
-            "Haram":   icon("x-circle",      13, "#C94040"),
-            "Syubhah": icon("alert-triangle", 13, "#B8922A"),
-            "Halal":   icon("check",          13, "#2D8A50"),
-            "Unknown": icon("minus-circle",   13, "#9E8C72"),
-        }
-
-        for item in details:
-            s = item["status"]
-            svg = status_svg.get(s, icon("minus-circle", 13, "#9E8C72"))
-            bl  = s.lower()
-
-            # Sanitize every field individually
-            t_code = safe_text(item["code"])
-            t_name = safe_text(item["name"])
-            t_desc = safe_text(item["description"])
-            t_ctx  = safe_text(item["context"])
-
-            # ── Card header (code + name + status) ──
-            # Construct HTML without indentation to prevent Markdown code-block rendering issues
-            ctx_html = f'<div class="ing-ctx">{icon("info",11,"#A89070")} {t_ctx}</div>' if t_ctx else ''
-            
-            st.markdown(f"""
-<div class="ing-card-wrap bl-{bl}">
-<div class="ing-header"><span><span class="ing-code">{t_code}</span><span class="ing-name">{t_name}</span></span><span class="ing-status {bl}">{svg} {s}</span></div>
-{ctx_html}
-<div class="ing-desc">{t_desc}</div>
-</div>""", unsafe_allow_html=True)
+        page = 0
+        pages = page_count(details)
+        if pages > 1:
+            if st.session_state.get("breakdown_page", 0) >= pages:
+                st.session_state.breakdown_page = 0  # left over from a longer label
+            page = st.radio("Page", range(pages), horizontal=True, key="breakdown_page",
+                            format_func=lambda p: f"{p * PAGE_SIZE + 1}–{min(total_items, (p + 1) * PAGE_SIZE)}")
+        with METRICS.span("render_breakdown"):
+            st.markdown(breakdown_html(details, page), unsafe_allow_html=True)
 
         st.markdown("<br>", unsafe_allow_html=True)
         with st.expander("Report Incorrect Info"):
@@ -650,11 +963,11 @@ with col2:
                 notes = st.text_area("What's wrong? / Apa masalahnya?")
                 submitted = st.form_submit_button("Submit Report")
                 if submitted:
-                    db.collection("reports").add({
-                        "item": missing_item, "notes": notes,
-                        "timestamp": firestore.SERVER_TIMESTAMP
-                    })
-                    st.toast("Report submitted! Thank you.")
+                    # Queued and written in the background; see report_writer.py
+                    if get_report_writer().submit(missing_item, notes):
+                        st.toast("Report submitted! Thank you.")
+                    else:
+                        st.toast("This report was already submitted. Thank you.")
 
     else:
         st.markdown(f"""
@@ -662,4 +975,38 @@ with col2:
             <div>{icon("bar-chart", 48, "#8B6914")}</div>
             <div class="placeholder-text">Your analysis results will appear here<br>after you upload and scan a label</div>
         </div>
-        """, unsafe_allow_html=True)
\ No newline at end of file
+        """, unsafe_allow_html=True)
+
+
+start_warm_up()
+
+
+# --- RERUN TIMING ---
+# Wall time of this script run; set HALAI_SHOW_TIMINGS=1 to show it in the sidebar
+rerun_ms = (time.perf_counter() - script_started) * 1000
+rerun_history = st.session_state.setdefault("rerun_ms", [])
+rerun_history.append(rerun_ms)
+del rerun_history[:-50]
+if os.getenv("HALAI_SHOW_TIMINGS"):
+    ordered = sorted(rerun_history)
+    st.sidebar.caption(f"Script run: {rerun_ms:.0f} ms · median {ordered[len(ordered) // 2]:.0f} ms "
+                       f"over {len(ordered)} runs")
+
+
+# --- ADMIN DEBUG PANEL ---
+# Set HALAI_ADMIN_PANEL=1 to see per-stage latency percentiles for this process
+if os.getenv("HALAI_ADMIN_PANEL"):
+    with st.sidebar.expander("Debug Metrics"):
+        stages = METRICS.summary()
+        if stages:
+            st.dataframe([{"Stage": name, "Count": row["count"], "p50 ms": round(row["p50"], 1),
+                           "p95 ms": round(row["p95"], 1), "p99 ms": round(row["p99"], 1)}
+                          for name, row in stages.items()], hide_index=True, use_container_width=True)
+        else:
+            st.caption("No scans yet.")
+        st.json({"counters": METRICS.counters(), "gemini": get_gemini_scheduler().stats(),
+                 "scan_cache": scan_cache.stats(), "verdict_cache": verdict_cache.stats(),
+                 "product_registry": product_registry.stats(), "cascade": extraction_cascade.stats(),
+                 "sessions": session_store.stats()}, expanded=False)
+        st.download_button("Prometheus metrics", METRICS.render_prometheus(), file_name="halai_metrics.txt",
+                           mime="text/plain", use_container_width=True)
@@ -0,0 +1,160 @@
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from ecode_cache import EcodeCache
+from ecode_index import INDEX_PATH
+from gemini_scheduler import GEMINI_RPM, GeminiScheduler
+from image_prep import MAX_EDGE
+from scan_cache import ScanCache
+from scanner import MODEL_NAME, safety_score, scan_label
+from verdict_cache import VerdictCache
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+WORKERS = 8             # images in flight (decode, preprocess, database check)
+GEMINI_CONCURRENCY = 4  # simultaneous generate_content calls
+CSV_FIELDS = ["file", "status", "score", "ingredients", "flagged", "error", "seconds"]
+
+
+# --- RESULT WRITER ---
+# Streams one verdict per line to an open text file as JSONL or CSV.
+class ResultWriter:
+    def __init__(self, stream, fmt="jsonl"):
+        self.stream = stream
+        self.fmt = fmt
+        self._csv = None
+        if fmt == "csv":
+            self._csv = csv.DictWriter(stream, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            self._csv.writeheader()
+
+    def write(self, record):
+        if self._csv is not None:
+            flagged = "; ".join(f"{d['code']} ({d['status']})" for d in record.get("details", [])
+                                if d["status"] in ("Haram", "Syubhah"))
+            self._csv.writerow({**record, "ingredients": len(record.get("details", [])), "flagged": flagged})
+        else:
+            self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+
+# --- BATCH SCANNER ---
+# Runs scan_label over many images on a bounded thread pool. At most
+# `workers` images are loaded at once, and Gemini calls are further limited
+# by `gemini_slots` (a semaphore that can be shared process-wide).
+class BatchScanner:
+    def __init__(self, model, get_many, scan_cache=None, workers=WORKERS, gemini_slots=None, max_edge=MAX_EDGE,
+                 verdict_cache=None):
+        self.model = model
+        self.get_many = get_many
+        self.scan_cache = scan_cache
+        self.verdict_cache = verdict_cache
+        self.workers = workers
+        self.gemini_slots = gemini_slots or threading.BoundedSemaphore(GEMINI_CONCURRENCY)
+        self.max_edge = max_edge
+
+    def scan_one(self, name, load):
+        started = time.perf_counter()
+        record = {"file": name, "status": None, "score": None, "details": [], "error": None}
+        try:
+            _, status, details = scan_label(load(), self.model, self.get_many, self.scan_cache,
+                                            self.gemini_slots, self.max_edge, self.verdict_cache)
+            record.update(status=status, score=safety_score(details), details=details)
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["seconds"] = round(time.perf_counter() - started, 3)
+        return record
+
+    # sources: iterable of (name, load) where load() returns the image bytes.
+    # on_record is called from the calling thread as each image finishes.
+    def run(self, sources, on_record):
+        started = time.perf_counter()
+        count = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = set()
+            for name, load in sources:
+                if len(pending) >= self.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        on_record(future.result())
+                        count += 1
+                pending.add(pool.submit(self.scan_one, name, load))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    on_record(future.result())
+                    count += 1
+
+        elapsed = time.perf_counter() - started
+        return {"images": count, "seconds": round(elapsed, 2),
+                "images_per_minute": round(count / elapsed * 60, 1) if elapsed > 0 else 0.0}
+
+
+def _file_loader(path):
+    def load():
+        with open(path, "rb") as f:
+            return f.read()
+    return load
+
+
+def iter_images(folder):
+    for name in sorted(os.listdir(folder)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            yield name, _file_loader(os.path.join(folder, name))
+
+
+# --- CLI ---
+#   python batch_scan.py labels/ --out verdicts.jsonl --workers 8 --gemini-concurrency 4
+def main():
+    parser = argparse.ArgumentParser(description="Scan every label photo in a folder.")
+    parser.add_argument("folder")
+    parser.add_argument("--out", default="verdicts.jsonl", help="output file (.jsonl or .csv)")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--gemini-concurrency", type=int, default=GEMINI_CONCURRENCY)
+    parser.add_argument("--max-edge", type=int, default=MAX_EDGE)
+    parser.add_argument("--rpm", type=int, default=int(os.getenv("HALAI_GEMINI_RPM", GEMINI_RPM)),
+                        help="Gemini requests per minute allowed by the quota")
+    args = parser.parse_args()
+
+    # The SDKs are only needed by the CLI, not by app.py importing BatchScanner
+    import firebase_admin
+    import google.generativeai as genai
+    from dotenv import load_dotenv
+    from firebase_admin import credentials, firestore
+
+    load_dotenv()
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    model = GeminiScheduler(genai.GenerativeModel(MODEL_NAME), rpm=args.rpm)
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate("firebase_key.json"))
+    ecode_cache = EcodeCache(firestore.client(), listen=False, index_path=INDEX_PATH)
+    scan_cache = ScanCache(disk_dir=os.getenv("HALAI_SCAN_CACHE_DIR"))
+    verdict_cache = VerdictCache(lambda: ecode_cache.version)
+
+    scanner = BatchScanner(model, ecode_cache.get_many, scan_cache, workers=args.workers,
+                           gemini_slots=threading.BoundedSemaphore(args.gemini_concurrency),
+                           max_edge=args.max_edge, verdict_cache=verdict_cache)
+    fmt = "csv" if args.out.lower().endswith(".csv") else "jsonl"
+    errors = 0
+
+    with open(args.out, "w", encoding="utf-8", newline="") as f:
+        writer = ResultWriter(f, fmt)
+
+        def on_record(record):
+            nonlocal errors
+            writer.write(record)
+            errors += record["error"] is not None
+            print(f"{record['file']}: {record['error'] or record['status']}")
+
+        stats = scanner.run(iter_images(args.folder), on_record)
+
+    print(f"\n{stats['images']} images in {stats['seconds']}s "
+          f"({stats['images_per_minute']} images/minute, {errors} errors) -> {args.out}")
+    print(f"Gemini: {model.stats()}")
+
+
+if __name__ == "__main__":
+    main()
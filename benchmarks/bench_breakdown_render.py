@@ -0,0 +1,115 @@
+# Detailed Breakdown rendering: one st.markdown element per ingredient card
+# (the old loop) against the single-element breakdown_html. Times building
+# the HTML alone, then the render step of a real Streamlit script run
+# (through AppTest), which includes creating and queueing every element.
+#
+#   python benchmarks/bench_breakdown_render.py
+import os
+import statistics
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streamlit.testing.v1 import AppTest
+
+from card_renderer import breakdown_html, icon
+from seed import ecodes_data
+
+LABEL_SIZES = [10, 40, 120]
+RUNS = 200
+SCRIPT_RUNS = 10
+
+
+def make_details(count):
+    keys = sorted(ecodes_data)
+    return [{"code": keys[i % len(keys)], "name": ecodes_data[keys[i % len(keys)]]["name"],
+             "status": ecodes_data[keys[i % len(keys)]]["status"],
+             "description": ecodes_data[keys[i % len(keys)]].get("description", ""),
+             "context": "from plant origin" if i % 3 else ""} for i in range(count)]
+
+
+# The card renderer as it was: icons looked up per card and five chained
+# str.replace passes per field
+def legacy_safe_text(text):
+    return (str(text).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+            .replace('"', "&quot;").replace("'", "&#39;"))
+
+
+LEGACY_SVG = {"Haram": icon("x-circle", 13, "#C94040"), "Syubhah": icon("alert-triangle", 13, "#B8922A"),
+              "Halal": icon("check", 13, "#2D8A50"), "Unknown": icon("minus-circle", 13, "#9E8C72")}
+
+
+def legacy_card_html(item):
+    s = item["status"]
+    svg = LEGACY_SVG.get(s, LEGACY_SVG["Unknown"])
+    bl = s.lower()
+    t_code, t_name = legacy_safe_text(item["code"]), legacy_safe_text(item["name"])
+    t_desc, t_ctx = legacy_safe_text(item["description"]), legacy_safe_text(item["context"])
+    ctx_html = f'<div class="ing-ctx">{icon("info",11,"#A89070")} {t_ctx}</div>' if t_ctx else ''
+    return f"""
+<div class="ing-card-wrap bl-{bl}">
+<div class="ing-header"><span><span class="ing-code">{t_code}</span><span class="ing-name">{t_name}</span></span><span class="ing-status {bl}">{svg} {s}</span></div>
+{ctx_html}
+<div class="ing-desc">{t_desc}</div>
+</div>"""
+
+
+# Script bodies run by AppTest; they import what they need themselves and
+# time only the rendering, as app.py's render_breakdown span does
+def per_card_script(count):
+    import time
+
+    import streamlit as st
+
+    from bench_breakdown_render import legacy_card_html, make_details
+
+    details = make_details(count)
+    started = time.perf_counter()
+    for item in details:
+        st.markdown(legacy_card_html(item), unsafe_allow_html=True)
+    st.session_state.render_ms = (time.perf_counter() - started) * 1000
+
+
+def single_element_script(count):
+    import time
+
+    import streamlit as st
+
+    from bench_breakdown_render import make_details
+    from card_renderer import breakdown_html
+
+    details = make_details(count)
+    started = time.perf_counter()
+    st.markdown(breakdown_html(details), unsafe_allow_html=True)
+    st.session_state.render_ms = (time.perf_counter() - started) * 1000
+
+
+def render_ms(script, count):
+    samples = []
+    for _ in range(SCRIPT_RUNS):
+        at = AppTest.from_function(script, args=(count,), default_timeout=30)
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+        samples.append(at.session_state.render_ms)
+    return statistics.median(samples), len(at.markdown)
+
+
+def main():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    print(f"{'cards':>5} {'build before us':>16} {'build after us':>15} "
+          f"{'render before ms':>17} {'render after ms':>16} {'elements':>9}")
+    for count in LABEL_SIZES:
+        details = make_details(count)
+        before_us = min(timeit.repeat(lambda: [legacy_card_html(item) for item in details],
+                                      number=RUNS, repeat=5)) / RUNS * 1e6
+        after_us = min(timeit.repeat(lambda: breakdown_html(details), number=RUNS, repeat=5)) / RUNS * 1e6
+        run_before, elements_before = render_ms(per_card_script, count)
+        run_after, elements_after = render_ms(single_element_script, count)
+        print(f"{count:>5} {before_us:>16.0f} {after_us:>15.0f} {run_before:>17.2f} {run_after:>16.2f} "
+              f"{elements_before:>4} -> {elements_after}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# Sequential vs batched ecodes lookups against a local Firestore emulator.
+#
+#   gcloud emulators firestore start --host-port=localhost:8080
+#   FIRESTORE_EMULATOR_HOST=localhost:8080 python benchmarks/bench_firestore_fetch.py
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.cloud import firestore
+
+from ecode_cache import ECODES_COLLECTION, fetch_ecodes
+
+LABEL_SIZES = [5, 25, 100]
+ROUNDS = 20
+
+
+def seed(db, count):
+    batch = db.batch()
+    collection = db.collection(ECODES_COLLECTION)
+    for i in range(count):
+        code = f"E{100 + i}"
+        batch.set(collection.document(code), {"code": code, "name": f"Additive {code}",
+                                              "status": "Halal", "source": "Bench", "description": ""})
+    batch.commit()
+
+
+def sequential(db, keys):
+    collection = db.collection(ECODES_COLLECTION)
+    return {k: collection.document(k).get().to_dict() for k in keys}
+
+
+def timed(fn, db, keys):
+    samples = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn(db, keys)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    if not os.getenv("FIRESTORE_EMULATOR_HOST"):
+        sys.exit("Set FIRESTORE_EMULATOR_HOST to point at a running Firestore emulator.")
+
+    db = firestore.Client(project=os.getenv("GCLOUD_PROJECT", "halai-bench"))
+    seed(db, max(LABEL_SIZES))
+
+    print(f"{'ingredients':>11} {'sequential ms':>14} {'get_all ms':>11} {'speedup':>8}")
+    for size in LABEL_SIZES:
+        # Mix in a few codes that are not in the collection, like a real label
+        keys = [f"E{100 + i}" for i in range(size - size // 5)] + [f"X{i}" for i in range(size // 5)]
+        seq_ms = timed(sequential, db, keys)
+        batch_ms = timed(fetch_ecodes, db, keys)
+        print(f"{size:>11} {seq_ms:>14.2f} {batch_ms:>11.2f} {seq_ms / batch_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# Per-query latency of the fuzzy fallback, against a brute-force edit
+# distance over every spelling in CODE_INDEX.
+#
+#   python benchmarks/bench_fuzzy_index.py
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fuzzy_index import MIN_CONFIDENCE, edit_distance
+from scanner import CODE_INDEX, compact_name, fuzzy_match
+
+QUERIES = ["Gelatine", "Carmin", "E47l", "E1OO", "Lecithine", "Xantan Gum", "Sodium Benzoat",
+           "Mono and Diglyceride", "Suger", "Water", "Hydrolysed Vegetable Protein", "E1401"]
+RUNS = 500
+
+
+def brute_force(code_str):
+    text = compact_name(code_str)
+    best = None
+    for spelling, key in CODE_INDEX.items():
+        longest = max(len(text), len(spelling))
+        distance = edit_distance(text, spelling, (1 - MIN_CONFIDENCE) * longest)
+        if distance is not None and (best is None or distance / longest < best[1]):
+            best = (key, distance / longest)
+    return best and (best[0], 1 - best[1])
+
+
+def main():
+    print(f"{len(CODE_INDEX)} spellings indexed")
+    print(f"{'query':<30} {'match':<12} {'conf':>5} {'index us':>9} {'brute us':>9}")
+    for query in QUERIES:
+        match = fuzzy_match(query)
+        index_us = timeit.timeit(lambda: fuzzy_match(query), number=RUNS) / RUNS * 1e6
+        brute_us = timeit.timeit(lambda: brute_force(query), number=RUNS // 10) / (RUNS // 10) * 1e6
+        key, confidence = match if match else ("-", 0.0)
+        print(f"{query:<30} {key:<12} {confidence:>5.2f} {index_us:>9.0f} {brute_us:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
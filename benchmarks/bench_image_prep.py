@@ -0,0 +1,90 @@
+# Payload size and extraction accuracy of image_prep on a folder of label photos.
+#
+#   python benchmarks/bench_image_prep.py path/to/labels/
+#
+# If the folder has a labels.json ({"photo.jpg": ["E471", "GELATIN", ...]}) and
+# GEMINI_API_KEY is set, each photo is also scanned raw, preprocessed, and
+# preprocessed with the text crop, and the recall of the expected codes is
+# compared. Text cropping stays off by default (image_prep.CROP_TEXT) until
+# this shows it loses nothing.
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from image_prep import MAX_EDGE, prepare_image
+from scanner import MODEL_NAME, extract_ingredients
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def code_set(ingredients):
+    return {str(i.get("code", "")).upper().replace(" ", "").replace("-", "") for i in ingredients}
+
+
+def recall(expected, found):
+    expected = {c.upper() for c in expected}
+    return len(expected & found) / len(expected) if expected else 1.0
+
+
+def main():
+    if len(sys.argv) < 2:
+        sys.exit("usage: bench_image_prep.py <fixture dir> [max_edge]")
+    folder = sys.argv[1]
+    max_edge = int(sys.argv[2]) if len(sys.argv) > 2 else MAX_EDGE
+
+    expected = {}
+    labels_path = os.path.join(folder, "labels.json")
+    if os.path.exists(labels_path):
+        with open(labels_path, encoding="utf-8") as f:
+            expected = json.load(f)
+
+    model = None
+    if expected and os.getenv("GEMINI_API_KEY"):
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        model = genai.GenerativeModel(MODEL_NAME)
+
+    total_raw = total_prepared = 0
+    raw_recalls, prep_recalls, crop_recalls = [], [], []
+    print(f"{'file':<32} {'raw KB':>8} {'prep KB':>8} {'saved':>6} {'prep ms':>8}")
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        with open(os.path.join(folder, name), "rb") as f:
+            raw = f.read()
+
+        start = time.perf_counter()
+        blob, _, stats = prepare_image(Image.open(io.BytesIO(raw)), len(raw), max_edge=max_edge)
+        prep_ms = (time.perf_counter() - start) * 1000
+
+        total_raw += len(raw)
+        total_prepared += stats["prepared_bytes"]
+        saved = stats["saved_bytes"] / len(raw)
+        print(f"{name:<32} {len(raw) / 1024:>8.0f} {stats['prepared_bytes'] / 1024:>8.0f} {saved:>6.0%} {prep_ms:>8.1f}")
+
+        if model is not None and name in expected:
+            raw_found = code_set(extract_ingredients(model, Image.open(io.BytesIO(raw))))
+            prep_found = code_set(extract_ingredients(model, blob))
+            crop_blob, _, _ = prepare_image(Image.open(io.BytesIO(raw)), len(raw), max_edge=max_edge, crop_text=True)
+            crop_found = code_set(extract_ingredients(model, crop_blob))
+            raw_recalls.append(recall(expected[name], raw_found))
+            prep_recalls.append(recall(expected[name], prep_found))
+            crop_recalls.append(recall(expected[name], crop_found))
+
+    if total_raw:
+        print(f"\nTotal: {total_raw / 1024:.0f} KB -> {total_prepared / 1024:.0f} KB "
+              f"({1 - total_prepared / total_raw:.0%} smaller)")
+    if raw_recalls:
+        print(f"Recall: raw {sum(raw_recalls) / len(raw_recalls):.1%}, "
+              f"preprocessed {sum(prep_recalls) / len(prep_recalls):.1%}, "
+              f"with text crop {sum(crop_recalls) / len(crop_recalls):.1%} over {len(raw_recalls)} labels")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# Keyword checks in check_database, before and after precompiling them.
+#
+#   python benchmarks/bench_keyword_matcher.py
+#
+# safe:  per-item list rebuild + two substring scans vs the hoisted tuple
+#        over one lowered haystack
+# alias: a substring loop over every KEYWORDS alias vs the token
+#        Aho-Corasick matcher (which also respects word boundaries)
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scanner import has_safe_keyword, resolve_alias
+from seed import ecodes_data
+
+TEXT_WORDS = 4, 12, 60, 300
+NAME = "Mono- and Diglycerides of Fatty Acids"
+RUNS = 5000
+
+ALIAS_LIST = [(alias.strip().lower(), key) for key, data in ecodes_data.items()
+              if not (key[0] == "E" and key[1:2].isdigit())
+              for alias in [key] + data["name"].split("/")]
+
+
+def old_safe(context, name):
+    lower_context = context.lower()
+    lower_name = name.lower()
+    safe_keywords = ["vegetable", "plant", "soy", "synthetic", "mineral", "vegan",
+                     "polyol", "gum", "cocoa", "fiber", "vanilla", "amino", "bcaa", "fermentation"]
+    return any(k in lower_context for k in safe_keywords) or any(k in lower_name for k in safe_keywords)
+
+
+def substring_alias(text):
+    lowered = text.lower()
+    best = max((alias for alias in ALIAS_LIST if alias[0] in lowered), key=lambda a: len(a[0]), default=None)
+    return best[1] if best else None
+
+
+def per_call_us(fn, *args):
+    return timeit.timeit(lambda: fn(*args), number=RUNS) / RUNS * 1e6
+
+
+def main():
+    random.seed(7)
+    vocabulary = ["contains", "permitted", "flavour", "colour", "from", "acid", "salt", "of", "and",
+                  "modified", "starch", "natural", "identical", "emulsifier", "stabiliser", "thickener"]
+    print(f"{'check':<6} {'words':>5} {'before us':>10} {'after us':>9} {'speedup':>8}")
+    for words in TEXT_WORDS:
+        # No safe keyword present: the worst case, every keyword is checked
+        text = " ".join(random.choice(vocabulary) for _ in range(words))
+        assert old_safe(text, NAME) == has_safe_keyword(text, NAME)
+        before, after = per_call_us(old_safe, text, NAME), per_call_us(has_safe_keyword, text, NAME)
+        print(f"{'safe':<6} {words:>5} {before:>10.2f} {after:>9.2f} {before / after:>7.1f}x")
+    for words in TEXT_WORDS:
+        text = " ".join(random.choice(vocabulary) for _ in range(words - 2)) + " beef gelatin"
+        before, after = per_call_us(substring_alias, text), per_call_us(resolve_alias, text)
+        print(f"{'alias':<6} {words:>5} {before:>10.2f} {after:>9.2f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
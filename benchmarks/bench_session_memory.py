@@ -0,0 +1,149 @@
+# Memory held by N concurrent sessions that each upload a large photo and
+# scan it, the old way against the bounded one:
+#   legacy:  full-resolution decode on every rerun, the whole photo passed
+#            to st.image, result dicts kept in st.session_state forever
+#   bounded: decode capped at MAX_DECODE_PIXELS and closed after the scan,
+#            a small preview JPEG, compact results in the SessionStore, idle
+#            sessions evicted
+# Each mode runs in its own process so the resident set sizes don't mix.
+#
+#   python benchmarks/bench_session_memory.py [--sessions 25] [--megapixels 8]
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from image_prep import decode_image, preview_jpeg
+from seed import ecodes_data
+from session_store import SessionStore, compact_results
+
+INGREDIENTS = 40
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+def peak_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def make_photo(megapixels):
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    noise = Image.effect_noise((width // 8, height // 8), 40).resize((width, height), Image.BILINEAR)
+    photo = Image.merge("RGB", (noise, noise.rotate(90, expand=False), noise.transpose(Image.FLIP_LEFT_RIGHT)))
+    buffer = io.BytesIO()
+    photo.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+# A verdict as check_database builds it: fresh strings per session, as they
+# come out of JSON and Firestore
+def make_results(session):
+    keys = sorted(ecodes_data)
+    details = []
+    for i in range(INGREDIENTS):
+        data = ecodes_data[keys[(session + i) % len(keys)]]
+        details.append({"code": "".join(keys[(session + i) % len(keys)]),
+                        "name": "".join(data["name"]), "status": "".join(data["status"]),
+                        "description": "".join(data.get("description", "")), "context": "from plant origin"})
+    return {"status": "Syubhah", "details": details}
+
+
+def run_mode(mode, sessions, photo_path):
+    with open(photo_path, "rb") as f:
+        photo = f.read()
+    uploads = [bytes(bytearray(photo)) for _ in range(sessions)]  # Streamlit keeps each upload either way
+    baseline = rss_mb()
+    started = time.perf_counter()
+
+    # Every session reruns at once (a toggle, a page change), no scan
+    if mode == "legacy":
+        shown = []
+        for upload in uploads:
+            image = Image.open(io.BytesIO(upload))
+            image.load()
+            shown.append(image)
+    else:
+        store = SessionStore(idle_timeout=0)
+        for session, upload in enumerate(uploads):
+            store.set(session, "preview", ("id", preview_jpeg(upload)))
+        shown = [store.get(session, "preview") for session in range(sessions)]
+    rerun = rss_mb()
+    del shown
+
+    # Every session scans at once and keeps its result
+    images = []
+    session_state = []
+    for session, upload in enumerate(uploads):
+        if mode == "legacy":
+            image = Image.open(io.BytesIO(upload))
+            image.load()
+            session_state.append({"results": make_results(session)})
+        else:
+            image = decode_image(upload)
+            store.set(session, "results", compact_results(make_results(session)))
+        images.append(image)
+    scanning = rss_mb()
+    if mode == "bounded":
+        for image in images:
+            image.close()
+    del images
+    after_scan = rss_mb()
+
+    # Everyone walks away; only the bounded store lets go
+    if mode == "bounded":
+        store._sweep(time.monotonic())
+    idle = rss_mb()
+    seconds = time.perf_counter() - started
+
+    return {"mode": mode, "sessions": sessions, "upload_kb": len(photo) // 1024,
+            "peak_mb": round(peak_mb() - baseline, 1), "rerun_mb": round(rerun - baseline, 1),
+            "scanning_mb": round(scanning - baseline, 1), "after_scan_mb": round(after_scan - baseline, 1),
+            "idle_mb": round(idle - baseline, 1), "seconds": round(seconds, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=25)
+    parser.add_argument("--megapixels", type=float, default=8)
+    parser.add_argument("--mode", choices=["legacy", "bounded"])
+    parser.add_argument("--photo")
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.sessions, args.photo)))
+        return
+
+    # Made here, so building the photo doesn't count towards either mode's peak
+    photo = tempfile.NamedTemporaryFile(suffix=".jpg", delete=False)
+    with photo:
+        photo.write(make_photo(args.megapixels))
+    print(f"{args.sessions} sessions, {args.megapixels:g} MP photos; MB above the process baseline")
+    print(f"{'mode':>8} {'upload KB':>10} {'peak':>8} {'reruns':>7} {'scanning':>9} {'after scan':>11} "
+          f"{'idle':>7} {'seconds':>8}")
+    try:
+        for mode in ("legacy", "bounded"):
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--mode", mode,
+                                  "--sessions", str(args.sessions), "--photo", photo.name],
+                                 capture_output=True, text=True, check=True).stdout
+            row = json.loads(out)
+            print(f"{mode:>8} {row['upload_kb']:>10} {row['peak_mb']:>8} {row['rerun_mb']:>7} {row['scanning_mb']:>9} "
+                  f"{row['after_scan_mb']:>11} {row['idle_mb']:>7} {row['seconds']:>8}")
+    finally:
+        os.unlink(photo.name)
+
+
+if __name__ == "__main__":
+    main()
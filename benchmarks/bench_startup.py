@@ -0,0 +1,61 @@
+# Cold-start import cost of app.py, from a `python -X importtime` breakdown.
+#
+#   python benchmarks/bench_startup.py [script.py] [top N]
+#
+# Runs only the script's module-level import statements in a fresh
+# interpreter (nothing is rendered, no clients are built), then prints the
+# total import time and the packages that contribute most to it. Anything
+# imported lazily inside a function does not count, which is the point.
+import ast
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def top_level_imports(path):
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+# Returns [(cumulative_us, depth, module)] from -X importtime stderr
+def run_importtime(code):
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        sys.exit(proc.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(cumulative), depth, name.strip()))
+    return rows
+
+
+def main():
+    script = sys.argv[1] if len(sys.argv) > 1 else os.path.join(ROOT, "app.py")
+    top_n = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+
+    # Modules the bare interpreter loads at startup are not the script's cost
+    baseline = {name for _, _, name in run_importtime("pass")}
+    rows = run_importtime(top_level_imports(script))
+    # Depth-0 rows are the imports the script itself triggered; group them by package
+    by_package = defaultdict(int)
+    for cumulative, depth, name in rows:
+        if depth == 0 and name not in baseline:
+            by_package[name.split(".")[0]] += cumulative
+    total = sum(by_package.values())
+
+    print(f"{os.path.basename(script)} top-level imports: {total / 1000:.0f} ms")
+    print(f"{'package':<28} {'ms':>8} {'share':>6}")
+    for name, cumulative in sorted(by_package.items(), key=lambda kv: -kv[1])[:top_n]:
+        print(f"{name:<28} {cumulative / 1000:>8.1f} {cumulative / total:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
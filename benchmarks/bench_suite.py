@@ -0,0 +1,250 @@
+# End-to-end benchmarks with no network: Gemini and Firestore are replaced by
+# the in-memory fakes in fakes.py, with configurable latencies. Covers the
+# database check across label sizes and cache states, whole scans across
+# concurrency levels with a cold and a warm scan cache, and multi-panel
+# products against a scan per photo. Results are written
+# as JSON so runs from two commits can be compared.
+#
+#   python benchmarks/bench_suite.py --out before.json
+#   python benchmarks/bench_suite.py --out after.json --compare before.json
+#   python benchmarks/bench_suite.py --quick --gemini-latency 0.2 --read-latency 0.01
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from batch_scan import BatchScanner
+from ecode_cache import EcodeCache, fetch_ecodes
+from ecode_index import INDEX_PATH
+from fakes import FakeFirestore, FakeGemini, make_ingredients
+from scan_cache import ScanCache
+from scanner import check_ingredients, collect_entries, scan_label, scan_panels
+from verdict_cache import VerdictCache
+
+LABEL_SIZES = [5, 25, 100]
+CONCURRENCY = [1, 4, 8]
+ROUNDS = 30
+IMAGES = 24
+QUICK_ROUNDS = 5
+QUICK_IMAGES = 8
+PANELS = 3  # photos of one product in the multi-panel benchmark
+
+
+def summarize(name, params, samples_ms, seconds, operations):
+    ordered = sorted(samples_ms)
+    return {
+        "name": name,
+        "params": params,
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3),
+        "ops_per_second": round(operations / seconds, 2) if seconds > 0 else 0.0,
+    }
+
+
+def time_calls(fn, rounds):
+    samples = []
+    started = time.perf_counter()
+    for i in range(rounds):
+        t = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - t) * 1000)
+    return samples, time.perf_counter() - started
+
+
+# --- DATABASE CHECK ---
+# check_ingredients on one label of `size` ingredients, per cache state:
+#   direct       one batched Firestore read per check, no cache
+#   cache_cold   a fresh EcodeCache per check (full collection load included)
+#   cache_warm   a loaded EcodeCache shared by every check
+#   index        EcodeCache served from the embedded SQLite index
+#   verdict_hit  cache_warm plus a VerdictCache that already holds the label
+def bench_check(db, index_path, rounds):
+    warm = EcodeCache(db, listen=False)
+    warm.get_many([])
+    indexed = EcodeCache(db, listen=False, index_path=index_path)
+    indexed.get_many([])
+    states = {
+        "direct": lambda: (lambda keys: fetch_ecodes(db, keys)),
+        "cache_cold": lambda: EcodeCache(db, listen=False).get_many,
+        "cache_warm": lambda: warm.get_many,
+        "index": lambda: indexed.get_many,
+    }
+
+    results = []
+    for size in LABEL_SIZES:
+        ingredients = make_ingredients(size, seed=size)
+        rows = []
+        for state, make_get_many in states.items():
+            samples, seconds = time_calls(lambda _: check_ingredients(ingredients, make_get_many()), rounds)
+            rows.append(summarize("check", {"ingredients": size, "cache": state}, samples, seconds, rounds))
+
+        verdicts = VerdictCache(lambda: warm.version)
+        check_ingredients(ingredients, warm.get_many, verdicts)
+        samples, seconds = time_calls(lambda _: check_ingredients(ingredients, warm.get_many, verdicts), rounds)
+        rows.append(summarize("check", {"ingredients": size, "cache": "verdict_hit"}, samples, seconds, rounds))
+
+        # Codes left after normalizing and deduping, i.e. what is looked up
+        distinct = len(collect_entries(ingredients))
+        for row in rows:
+            row["distinct_codes"] = distinct
+        results += rows
+    return results
+
+
+# --- WHOLE SCANS ---
+# Distinct synthetic label photos, so every image misses the scan cache once
+def make_images(count, size=(1600, 1200)):
+    images = []
+    for i in range(count):
+        image = Image.new("RGB", size, (250, 250 - i % 50, 240))
+        for x in range(0, size[0], 40):
+            image.putpixel((x, i % size[1]), (i % 256, 0, 0))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def bench_scans(db, images, gemini_latency):
+    get_many = EcodeCache(db, listen=False).get_many
+    sources = [(f"label-{i}.jpg", (lambda data=data: data)) for i, data in enumerate(images)]
+
+    results = []
+    for workers in CONCURRENCY:
+        gemini = FakeGemini(latency=gemini_latency)
+        scan_cache = ScanCache()
+        for cache_state in ("cold", "warm"):
+            scanner = BatchScanner(gemini, get_many, scan_cache, workers=workers,
+                                   gemini_slots=threading.BoundedSemaphore(workers))
+            records = []
+            started = time.perf_counter()
+            summary = scanner.run(sources, records.append)
+            seconds = time.perf_counter() - started
+            errors = [r["error"] for r in records if r["error"]]
+            if errors:
+                raise RuntimeError(f"scan failed: {errors[0]}")
+            result = summarize("scan", {"concurrency": workers, "scan_cache": cache_state},
+                               [r["seconds"] * 1000 for r in records], seconds, summary["images"])
+            result["gemini_calls"] = gemini.calls
+            results.append(result)
+    return results
+
+
+# One product photographed as PANELS photos: a scan per photo against one
+# multi-panel request, sent as separate images or tiled onto one canvas.
+# The fake answers every call in the same time, however many images it
+# carries.
+def bench_panels(db, images, gemini_latency, rounds):
+    get_many = EcodeCache(db, listen=False).get_many
+    products = [images[i:i + PANELS] for i in range(0, len(images) - PANELS + 1, PANELS)][:rounds]
+    modes = {
+        "per_photo": lambda model, panels: [scan_label(data, model, get_many) for data in panels],
+        "one_request": lambda model, panels: scan_panels(panels, model, get_many),
+        "tiled": lambda model, panels: scan_panels(panels, model, get_many, tile=True),
+    }
+
+    results = []
+    for mode, scan in modes.items():
+        gemini = FakeGemini(latency=gemini_latency)
+        samples, seconds = time_calls(lambda i: scan(gemini, products[i]), len(products))
+        result = summarize("panels", {"panels": PANELS, "mode": mode}, samples, seconds, len(products))
+        result["gemini_calls"] = gemini.calls
+        results.append(result)
+    return results
+
+
+# --- RESULTS ---
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_id(result):
+    return result["name"] + " " + " ".join(f"{k}={v}" for k, v in sorted(result["params"].items()))
+
+
+def print_results(results, baseline=None):
+    before = {result_id(r): r for r in baseline["results"]} if baseline else {}
+    header = f"{'benchmark':<46} {'p50 ms':>9} {'p95 ms':>9} {'ops/s':>9}"
+    print(header + (f" {'p50 vs base':>12}" if before else ""))
+    for result in results:
+        key = result_id(result)
+        line = f"{key:<46} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['ops_per_second']:>9.1f}"
+        if key in before and before[key]["p50_ms"]:
+            change = (result["p50_ms"] - before[key]["p50_ms"]) / before[key]["p50_ms"] * 100
+            line += f" {change:>+11.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite for the scan pipeline.")
+    parser.add_argument("--gemini-latency", type=float, default=0.8, help="seconds per fake Gemini call")
+    parser.add_argument("--read-latency", type=float, default=0.03, help="seconds per fake Firestore round trip")
+    parser.add_argument("--quick", action="store_true", help="fewer rounds and images")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="earlier --out file to compare against")
+    args = parser.parse_args()
+
+    rounds = QUICK_ROUNDS if args.quick else ROUNDS
+    image_count = QUICK_IMAGES if args.quick else IMAGES
+    db = FakeFirestore(read_latency=args.read_latency)
+
+    # The index sync may rewrite the file, so work on a copy
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        index_path = os.path.join(tmp_dir, "ecodes.sqlite")
+        shutil.copyfile(INDEX_PATH, index_path)
+        results = bench_check(db, index_path, rounds)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    images = make_images(image_count)
+    results += bench_scans(db, images, args.gemini_latency)
+    results += bench_panels(db, images, args.gemini_latency, rounds)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "gemini_latency": args.gemini_latency,
+            "read_latency": args.read_latency,
+            "rounds": rounds,
+            "images": image_count,
+        },
+        "results": results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Baseline: commit {baseline['meta'].get('commit')} from {baseline['meta'].get('timestamp')}")
+    print_results(results, baseline)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(results)} results to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
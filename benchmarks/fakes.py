@@ -0,0 +1,138 @@
+# Offline stand-ins for Gemini and Firestore, for benchmarks only.
+#
+# FakeGemini answers generate_content with a generated ingredient list after
+# a configurable delay; FakeFirestore is an in-memory ecodes collection
+# seeded from seed.py with a configurable delay per round trip. Both
+# implement just the calls the scanner, EcodeCache and batch scanner make.
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from ecode_index import VERSION_COLLECTION, VERSION_DOC, data_version
+from seed import ecodes_data
+
+# Spellings Gemini really returns for codes that are not exact document keys
+GARBLED = ["Gelatine", "Carmin", "E47l", "Mono & Diglycerides", "Soya Lecithin", "E 322", "INS 471", "E999"]
+
+
+# Deterministic ingredient lists: the same (count, seed) always gives the
+# same label
+def make_ingredients(count, seed=0, garbled_share=0.2):
+    rng = random.Random(seed)
+    keys = sorted(ecodes_data)
+    items = []
+    for _ in range(count):
+        if rng.random() < garbled_share:
+            code = rng.choice(GARBLED)
+        else:
+            code = ecodes_data[rng.choice(keys)]["code"] if rng.random() < 0.5 else rng.choice(keys)
+        items.append({"code": code, "context": rng.choice(["", "", "plant origin", "from pork", "soy"])})
+    return items
+
+
+class FakeGemini:
+    def __init__(self, latency=0.8, ingredient_count=12, chunk_latency=0.05, seed=0):
+        self.latency = latency
+        self.ingredient_count = ingredient_count
+        self.chunk_latency = chunk_latency
+        self.seed = seed
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _response_text(self):
+        with self._lock:
+            self.calls += 1
+        return json.dumps(make_ingredients(self.ingredient_count, self.seed))
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        text = self._response_text()
+        usage = SimpleNamespace(prompt_token_count=1300, candidates_token_count=len(text) // 4,
+                                total_token_count=1300 + len(text) // 4)
+        if not stream:
+            time.sleep(self.latency)
+            return SimpleNamespace(text=text, usage_metadata=usage)
+        return self._stream(text, usage)
+
+    def _stream(self, text, usage):
+        time.sleep(self.latency)
+        step = max(1, len(text) // 8)
+        for start in range(0, len(text), step):
+            time.sleep(self.chunk_latency)
+            yield SimpleNamespace(text=text[start:start + step], usage_metadata=usage)
+
+
+# --- FIRESTORE ---
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, db, collection, doc_id):
+        self.db = db
+        self.collection = collection
+        self.id = doc_id
+
+    def get(self):
+        self.db.round_trip()
+        return FakeSnapshot(self.id, self.db.data.get(self.collection, {}).get(self.id))
+
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    def document(self, doc_id):
+        return FakeDocument(self.db, self.name, doc_id)
+
+    def stream(self):
+        self.db.round_trip()
+        return [FakeSnapshot(k, v) for k, v in self.db.data.get(self.name, {}).items()]
+
+    # Delivers the current documents once, as an initial Firestore snapshot
+    # does; later writes to the fake are not pushed
+    def on_snapshot(self, callback):
+        docs = self.stream()
+        changes = [SimpleNamespace(type=SimpleNamespace(name="ADDED"), document=doc) for doc in docs]
+        callback(docs, changes, time.time())
+        return FakeWatch()
+
+
+class FakeWatch:
+    def __init__(self):
+        self.is_active = True
+
+    def unsubscribe(self):
+        self.is_active = False
+
+
+class FakeFirestore:
+    def __init__(self, read_latency=0.03, data=None):
+        self.read_latency = read_latency
+        if data is None:
+            # Stamped like seed.py does, so an index built from seed.py is current
+            data = {"ecodes": {k: dict(v) for k, v in ecodes_data.items()},
+                    VERSION_COLLECTION: {VERSION_DOC: {"version": data_version(ecodes_data)}}}
+        self.data = data
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    def round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        time.sleep(self.read_latency)
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def get_all(self, refs):
+        self.round_trip()
+        return [FakeSnapshot(r.id, self.data.get(r.collection, {}).get(r.id)) for r in refs]
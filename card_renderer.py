@@ -0,0 +1,110 @@
+import functools
+
+# Cards shown before the rest of a long breakdown folds away; flagged
+# (Haram/Syubhah) cards are always shown
+VISIBLE_CARDS = 12
+PAGE_SIZE = 60  # cards per breakdown element; longer lists get pages
+
+ICON_PATHS = {
+    "smartphone":     '<rect x="5" y="2" width="14" height="20" rx="2" ry="2"/><line x1="12" y1="18" x2="12.01" y2="18"/>',
+    "shield":         '<path d="M12 22s8-4 8-10V5l-8-3-8 3v7c0 6 8 10 8 10z"/>',
+    "upload-cloud":   '<polyline points="16 16 12 12 8 16"/><line x1="12" y1="12" x2="12" y2="21"/><path d="M20.39 18.39A5 5 0 0 0 18 9h-1.26A8 8 0 1 0 3 16.3"/>',
+    "scan":           '<path d="M3 7V5a2 2 0 0 1 2-2h2"/><path d="M17 3h2a2 2 0 0 1 2 2v2"/><path d="M21 17v2a2 2 0 0 1-2 2h-2"/><path d="M7 21H5a2 2 0 0 1-2-2v-2"/><line x1="7" y1="12" x2="17" y2="12"/>',
+    "bar-chart":      '<line x1="12" y1="20" x2="12" y2="10"/><line x1="18" y1="20" x2="18" y2="4"/><line x1="6" y1="20" x2="6" y2="16"/>',
+    "share-2":        '<circle cx="18" cy="5" r="3"/><circle cx="6" cy="12" r="3"/><circle cx="18" cy="19" r="3"/><line x1="8.59" y1="13.51" x2="15.42" y2="17.49"/><line x1="15.41" y1="6.51" x2="8.59" y2="10.49"/>',
+    "list":           '<line x1="8" y1="6" x2="21" y2="6"/><line x1="8" y1="12" x2="21" y2="12"/><line x1="8" y1="18" x2="21" y2="18"/><line x1="3" y1="6" x2="3.01" y2="6"/><line x1="3" y1="12" x2="3.01" y2="12"/><line x1="3" y1="18" x2="3.01" y2="18"/>',
+    "flag":           '<path d="M4 15s1-1 4-1 5 2 8 2 4-1 4-1V3s-1 1-4 1-5-2-8-2-4 1-4 1z"/><line x1="4" y1="22" x2="4" y2="15"/>',
+    "send":           '<line x1="22" y1="2" x2="11" y2="13"/><polygon points="22 2 15 22 11 13 2 9 22 2"/>',
+    "info":           '<circle cx="12" cy="12" r="10"/><line x1="12" y1="16" x2="12" y2="12"/><line x1="12" y1="8" x2="12.01" y2="8"/>',
+    "zap":            '<polygon points="13 2 3 14 12 14 11 22 21 10 12 10 13 2"/>',
+    "x-circle":       '<circle cx="12" cy="12" r="10"/><line x1="15" y1="9" x2="9" y2="15"/><line x1="9" y1="9" x2="15" y2="15"/>',
+    "alert-triangle": '<path d="M10.29 3.86L1.82 18a2 2 0 0 0 1.71 3h16.94a2 2 0 0 0 1.71-3L13.71 3.86a2 2 0 0 0-3.42 0z"/><line x1="12" y1="9" x2="12" y2="13"/><line x1="12" y1="17" x2="12.01" y2="17"/>',
+    "check-circle":   '<path d="M22 11.08V12a10 10 0 1 1-5.93-9.14"/><polyline points="22 4 12 14.01 9 11.01"/>',
+    "check":          '<polyline points="20 6 9 16 4 11"/>',
+    "minus-circle":   '<circle cx="12" cy="12" r="10"/><line x1="8" y1="12" x2="16" y2="12"/>',
+    "menu":           '<line x1="3" y1="12" x2="21" y2="12"/><line x1="3" y1="6" x2="21" y2="6"/><line x1="3" y1="18" x2="21" y2="18"/>',
+}
+
+
+# --- SVG ICON HELPER ---
+# Called dozens of times per rerun with the same few arguments
+@functools.lru_cache(maxsize=None)
+def icon(name, size=16, color="currentColor"):
+    inner = ICON_PATHS.get(name, "")
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
+        f'viewBox="0 0 24 24" fill="none" stroke="{color}" '
+        f'stroke-width="1.75" stroke-linecap="round" stroke-linejoin="round" '
+        f'style="display:inline-block;vertical-align:middle;flex-shrink:0">'
+        f'{inner}</svg>'
+    )
+
+
+# --- SAFE TEXT HELPER ---
+# Strips ALL HTML from AI-generated text so it never breaks card rendering.
+# Line breaks become spaces: a blank line would end the HTML block the whole
+# breakdown is rendered in. Chained str.replace beats str.translate here,
+# since most text has nothing to replace.
+def safe_text(text):
+    return (str(text)
+            .replace("&", "&amp;")
+            .replace("<", "&lt;")
+            .replace(">", "&gt;")
+            .replace('"', "&quot;")
+            .replace("'", "&#39;")
+            .replace("\r", " ")
+            .replace("\n", " "))
+
+
+# --- INGREDIENT CARDS ---
+# Icons are built once at import and the card template is a single
+# f-string. Every line starts at column 0 and no line is blank, so Markdown
+# never turns part of a card into a code block or paragraph.
+STATUS_SVG = {
+    "Haram":   icon("x-circle",      13, "#C94040"),
+    "Syubhah": icon("alert-triangle", 13, "#B8922A"),
+    "Halal":   icon("check",          13, "#2D8A50"),
+    "Unknown": icon("minus-circle",   13, "#9E8C72"),
+}
+CONTEXT_SVG = icon("info", 11, "#A89070")
+FLAGGED = ("Haram", "Syubhah")
+
+
+# All four text fields go through one safe_text pass, joined by a control
+# character that safe_text leaves alone
+def ingredient_card_html(item):
+    s = item["status"]
+    bl = s.lower()
+    svg = STATUS_SVG.get(s) or STATUS_SVG["Unknown"]
+    code, name, context, desc = safe_text(
+        f'{item["code"]}\0{item["name"]}\0{item["context"]}\0{item["description"]}').split("\0", 3)
+    ctx_html = f'<div class="ing-ctx">{CONTEXT_SVG} {context}</div>\n' if context else ""
+    return (f'<div class="ing-card-wrap bl-{bl}">\n'
+            f'<div class="ing-header"><span><span class="ing-code">{code}</span><span class="ing-name">{name}</span></span>'
+            f'<span class="ing-status {bl}">{svg} {s}</span></div>\n'
+            f'{ctx_html}'
+            f'<div class="ing-desc">{desc}</div>\n'
+            f'</div>\n')
+
+
+# --- DETAILED BREAKDOWN ---
+# The whole breakdown (or one page of it) as a single HTML block, for one
+# st.markdown call instead of one element per ingredient. Past the first
+# `visible` cards (never hiding a flagged one) the rest fold into a
+# <details> the user can open.
+def page_count(details, page_size=PAGE_SIZE):
+    return max(1, -(-len(details) // page_size))
+
+
+def breakdown_html(details, page=0, page_size=PAGE_SIZE, visible=VISIBLE_CARDS):
+    items = details[page * page_size:(page + 1) * page_size]
+    shown = max(visible, sum(1 for item in items if item["status"] in FLAGGED))
+    parts = ['<div class="ing-list">\n']
+    parts += [ingredient_card_html(item) for item in items[:shown]]
+    rest = items[shown:]
+    if rest:
+        parts.append(f'<details class="ing-more">\n<summary>Show {len(rest)} more ingredients</summary>\n')
+        parts += [ingredient_card_html(item) for item in rest]
+        parts.append("</details>\n")
+    parts.append("</div>")
+    return "".join(parts)
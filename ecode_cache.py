@@ -0,0 +1,192 @@
+import threading
+import time
+
+from ecode_index import data_version, fetch_remote_version, load_index, write_index
+
+ECODES_COLLECTION = "ecodes"
+REFRESH_TTL = 600  # seconds between full reloads when no live listener is running
+
+
+# --- BATCHED FETCH ---
+# One get_all round trip for any number of documents, instead of one
+# document().get() per code. Missing codes map to None.
+def fetch_ecodes(db, code_keys):
+    code_keys = list(dict.fromkeys(code_keys))
+    if not code_keys:
+        return {}
+    collection = db.collection(ECODES_COLLECTION)
+    refs = [collection.document(k) for k in code_keys]
+    found = {doc.id: doc.to_dict() for doc in db.get_all(refs) if doc.exists}
+    return {k: found.get(k) for k in code_keys}
+
+
+# --- PROCESS-WIDE E-CODE CACHE ---
+# Holds the whole 'ecodes' collection in memory. It is loaded once, then kept
+# fresh by a Firestore snapshot listener; if the listener cannot be started
+# (or dies) the cache falls back to a full reload every REFRESH_TTL seconds.
+# Codes that are not in the snapshot resolve to None without another read.
+#
+# With an index_path (see ecode_index.py) the cache starts from the embedded
+# index instead and never blocks on Firestore: every `ttl` seconds a
+# background thread compares the Firestore version stamp with the index and
+# only reloads (and rewrites the index) when they differ. No listener runs in
+# this mode, and lookups keep working with no network at all.
+class EcodeCache:
+    def __init__(self, db, ttl=REFRESH_TTL, listen=True, index_path=None):
+        self.db = db
+        self.ttl = ttl
+        self.listen = listen
+        self.index_path = index_path
+        self.version = None
+        self._docs = {}
+        self._missing = set()
+        self._complete = False
+        self._from_index = False
+        self._syncing = False
+        self._loaded_at = 0.0
+        self._watch = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+        if index_path:
+            docs, version = load_index(index_path)
+            if docs is not None:
+                self._docs = docs
+                self._complete = True
+                self._from_index = True
+                self.version = version
+
+    # --- LOADING ---
+    def _load(self):
+        try:
+            docs = {doc.id: doc.to_dict() for doc in self.db.collection(ECODES_COLLECTION).stream()}
+        except Exception:
+            # Keep serving whatever we have; lookups fall back to single reads
+            with self._lock:
+                self._loaded_at = time.monotonic()
+            return
+        with self._lock:
+            self._docs = docs
+            self._missing.clear()
+            self._complete = True
+            self.version = data_version(docs)
+            self._loaded_at = time.monotonic()
+        if self.index_path:
+            # No usable index at startup: leave one for the next start
+            try:
+                write_index(self.index_path, docs, self.version)
+            except OSError:
+                pass
+
+    def _start_listener(self):
+        if not self.listen or (self._watch is not None and self._watch.is_active):
+            return
+        try:
+            self._watch = self.db.collection(ECODES_COLLECTION).on_snapshot(self._on_snapshot)
+        except Exception:
+            self._watch = None
+
+    def _on_snapshot(self, col_snapshot, changes, read_time):
+        with self._lock:
+            for change in changes:
+                doc_id = change.document.id
+                if change.type.name == "REMOVED":
+                    self._docs.pop(doc_id, None)
+                else:
+                    self._docs[doc_id] = change.document.to_dict()
+                    self._missing.discard(doc_id)
+            self.version = data_version(self._docs)
+            self._loaded_at = time.monotonic()
+
+    def _listener_alive(self):
+        return self._watch is not None and self._watch.is_active
+
+    def _is_fresh(self):
+        return bool(self._loaded_at) and (self._listener_alive() or time.monotonic() - self._loaded_at < self.ttl)
+
+    # Index mode: reload only when the Firestore version stamp has moved on
+    def _sync_index(self):
+        try:
+            remote_version = fetch_remote_version(self.db)
+            if remote_version is None or remote_version != self.version:
+                docs = {doc.id: doc.to_dict() for doc in self.db.collection(ECODES_COLLECTION).stream()}
+                version = remote_version or data_version(docs)
+                if version != self.version:
+                    with self._lock:
+                        self._docs = docs
+                        self._missing.clear()
+                        self.version = version
+                    try:
+                        write_index(self.index_path, docs, version)
+                    except OSError:
+                        pass  # read-only install: the next start re-syncs
+        except Exception:
+            pass  # offline: keep serving the index and try again after ttl
+        finally:
+            with self._lock:
+                self._loaded_at = time.monotonic()
+                self._syncing = False
+
+    def _ensure_fresh(self):
+        if self._is_fresh():
+            return
+        if self._from_index:
+            with self._lock:
+                if self._syncing:
+                    return
+                self._syncing = True
+            threading.Thread(target=self._sync_index, name="ecode-index-sync", daemon=True).start()
+            return
+        # Only one session reloads; the others wait and reuse its result
+        with self._load_lock:
+            if self._is_fresh():
+                return
+            self._load()
+            self._start_listener()
+
+    # --- LOOKUPS ---
+    def get(self, code_key):
+        return self.get_many([code_key])[code_key]
+
+    def get_many(self, code_keys):
+        self._ensure_fresh()
+        results = {}
+        pending = []
+        with self._lock:
+            for key in code_keys:
+                if key in self._docs:
+                    results[key] = self._docs[key]
+                elif self._complete or key in self._missing:
+                    results[key] = None
+                else:
+                    pending.append(key)
+        if not pending:
+            return results
+
+        # Collection could not be loaded: fetch the rest in one batch and
+        # remember the answers (including misses) until the next refresh.
+        fetched = fetch_ecodes(self.db, pending)
+        with self._lock:
+            for key, data in fetched.items():
+                if data is None:
+                    self._missing.add(key)
+                else:
+                    self._docs[key] = data
+        results.update(fetched)
+        return results
+
+    # All document ids, or None while the full collection is not loaded
+    def keys(self):
+        self._ensure_fresh()
+        with self._lock:
+            return set(self._docs) if self._complete else None
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+            self._complete = self._from_index
+
+    def close(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+# Set HALAI_INDEX_PATH to keep the index somewhere writable
+INDEX_PATH = os.getenv("HALAI_INDEX_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "ecodes.sqlite")
+SCHEMA_VERSION = 1
+# Firestore document holding the version of the ecodes collection; seed.py
+# updates it whenever it writes the collection
+VERSION_COLLECTION = "meta"
+VERSION_DOC = "ecodes"
+
+
+# --- DATA VERSION ---
+# Stable hash of the whole table, so the same data always gets the same stamp
+def data_version(docs):
+    return hashlib.sha256(json.dumps(docs, sort_keys=True, ensure_ascii=False).encode()).hexdigest()[:16]
+
+
+# --- EMBEDDED OFFLINE INDEX ---
+# A small SQLite file shipped with the app, holding every E-code document as
+# JSON plus the data version it was built from. EcodeCache loads it at
+# startup so lookups never wait on the network.
+def write_index(path, docs, version=None):
+    version = version or data_version(docs)
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute("CREATE TABLE ecodes (key TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        conn.executemany("INSERT INTO meta VALUES (?, ?)",
+                         [("schema", str(SCHEMA_VERSION)), ("version", version)])
+        conn.executemany("INSERT INTO ecodes VALUES (?, ?)",
+                         [(key, json.dumps(data, sort_keys=True, ensure_ascii=False)) for key, data in sorted(docs.items())])
+        conn.commit()
+    finally:
+        conn.close()
+    # Readers see either the old file or the new one, never a partial write
+    os.replace(tmp_path, path)
+    return version
+
+
+# Returns (docs, version), or (None, None) if the file is missing, unreadable
+# or from another schema
+def load_index(path=INDEX_PATH):
+    if not os.path.exists(path):
+        return None, None
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+            if meta.get("schema") != str(SCHEMA_VERSION):
+                return None, None
+            docs = {key: json.loads(data) for key, data in conn.execute("SELECT key, data FROM ecodes")}
+        finally:
+            conn.close()
+    except (sqlite3.Error, ValueError):
+        return None, None
+    return docs, meta.get("version")
+
+
+# The version stamp stored in Firestore, or None if it has never been written
+def fetch_remote_version(db):
+    doc = db.collection(VERSION_COLLECTION).document(VERSION_DOC).get()
+    return (doc.to_dict() or {}).get("version") if doc.exists else None
+
+
+# Rebuilds the shipped index from seed.py:  python ecode_index.py
+if __name__ == "__main__":
+    from seed import ecodes_data
+
+    version = write_index(INDEX_PATH, ecodes_data)
+    print(f"Wrote {len(ecodes_data)} E-codes to {INDEX_PATH} (version {version})")
@@ -0,0 +1,222 @@
+import functools
+import re
+import threading
+from collections import deque
+
+from PIL import ImageOps
+
+from ingredient_parser import parse_ingredient_text
+from metrics import METRICS
+from scanner import fuzzy_match, normalize_code, resolve_alias
+
+MIN_CONFIDENCE = 0.85     # mean OCR word confidence (0-1) over the ingredient list
+MIN_COVERAGE = 1.0        # share of list items found in the database: one unknown item goes to Gemini
+MIN_WORD_CONFIDENCE = 70  # Tesseract's 0-100 scale
+OCR_EDGE = 2000           # longest side handed to the OCR engine, in pixels
+RECENT_SAMPLES = 500      # recent local reads kept for threshold sweeps
+SWEEP = (0.6, 0.7, 0.8, 0.85, 0.9, 0.95)
+FLAGGED = ("Haram", "Syubhah")
+
+# Where the ingredient list starts ("Ingredients:", "Bahan-bahan:") and what
+# usually follows it on a pack
+HEADER_RE = re.compile(r"\b(ingredients?|ingredien|bahan-bahan|bahan|kandungan)\s*[:\-]", re.I)
+SECTION_END_RE = re.compile(r"\b(nutrition|nutritional|maklumat pemakanan|allergen|storage|store in|"
+                            r"best before|manufactured|produced|distributed|net weight)\b", re.I)
+CODE_LIKE_RE = re.compile(r"\d")
+
+
+# --- OCR ENGINE ---
+# pytesseract plus the tesseract binary, when both are installed. Neither is
+# a requirement: without them every scan goes to Gemini, as before.
+@functools.lru_cache(maxsize=1)
+def ocr_engine():
+    try:
+        import pytesseract
+
+        pytesseract.get_tesseract_version()
+    except Exception:
+        return None
+    return pytesseract
+
+
+# OCR lines of (word, confidence) pairs, or None when no engine is available
+def ocr_lines(image):
+    engine = ocr_engine()
+    if engine is None:
+        return None
+    image = ImageOps.exif_transpose(image).convert("L")
+    image.thumbnail((OCR_EDGE, OCR_EDGE))
+    data = engine.image_to_data(image, output_type=engine.Output.DICT)
+    lines = {}
+    for word, confidence, block, paragraph, line in zip(data["text"], data["conf"], data["block_num"],
+                                                        data["par_num"], data["line_num"]):
+        if word.strip() and float(confidence) >= 0:
+            lines.setdefault((block, paragraph, line), []).append((word, float(confidence)))
+    return [lines[key] for key in sorted(lines)]
+
+
+# The words of the ingredient list: from the header to the next section,
+# or None when the label has no recognizable header
+def ingredient_section(lines):
+    words = [pair for line in lines for pair in line + [("\n", 100.0)]]
+    text = " ".join(word for word, _ in words)
+    header = HEADER_RE.search(text)
+    if header is None:
+        return None
+    end = SECTION_END_RE.search(text, header.end())
+    start_at, end_at = header.start(), end.start() if end else len(text)
+
+    section, position = [], 0
+    for word, confidence in words:
+        if start_at <= position < end_at:
+            section.append((word, confidence))
+        position += len(word) + 1
+    return section
+
+
+# True when an ingredient reaches a database entry the way check_ingredients
+# would find it: exact spelling, alias or fuzzy match. Context words
+# ("Vegetable") are not ingredients and count as found.
+def resolves(item, known_keys):
+    code_str = item.get("code", "")
+    code_key = normalize_code(code_str)
+    if code_key is None:
+        return True
+    if known_keys is not None and code_key in known_keys:
+        return True
+    return resolve_alias(code_str) is not None or fuzzy_match(code_str) is not None
+
+
+# --- LOCAL EXTRACTION ---
+# Reads the label with OCR and parses the ingredient list locally. Returns
+# (ingredients, confidence, coverage): confidence is the mean word
+# confidence, coverage the share of list items that resolve to a database
+# entry. Both are 0 when there is no list to read. Coverage only measures
+# the parse: an item the parser could not place (an OCR misread of "Lard",
+# an ingredient missing from the database) leaves it below 1.
+def extract_local(image, known_keys=None):
+    lines = ocr_lines(image)
+    if lines is None:
+        return None
+    section = ingredient_section(lines)
+    words = [(w, c) for w, c in section or [] if w != "\n"]
+    if not words:
+        return [], 0.0, 0.0
+
+    confidence = sum(c for _, c in words) / len(words) / 100
+    # Lists wrap at arbitrary points, so OCR lines are joined with spaces
+    ingredients = parse_ingredient_text(" ".join(w for w, _ in words), known_keys)
+    coverage = sum(1 for item in ingredients if resolves(item, known_keys)) / len(ingredients) if ingredients else 0.0
+    # One misread digit is a different additive: any shaky code sinks the tier
+    if any(c < MIN_WORD_CONFIDENCE for w, c in words if CODE_LIKE_RE.search(w)):
+        coverage = 0.0
+    return ingredients, confidence, coverage
+
+
+# --- EXTRACTION CASCADE ---
+# Tier 1 is local OCR plus the ingredient parser; its result is used when
+# the list reads cleanly enough (mean word confidence over the threshold),
+# every item in it resolves to a database entry, and it names at least one
+# ingredient. Everything else falls through to Gemini (tier 2). Counts per
+# tier and recent (confidence, coverage) samples are kept so the thresholds can be tuned against quota:
+# threshold_sweep() shows the local share each confidence threshold would
+# have given.
+#
+# known_keys: callable returning the ecodes ids (or None), as for pasted text.
+class ExtractionCascade:
+    def __init__(self, known_keys, min_confidence=MIN_CONFIDENCE, min_coverage=MIN_COVERAGE):
+        self.known_keys = known_keys
+        self.min_confidence = min_confidence
+        self.min_coverage = min_coverage
+        self.local = 0
+        self.gemini = 0
+        self.unavailable = 0
+        self._samples = deque(maxlen=RECENT_SAMPLES)
+        self._lock = threading.Lock()
+
+    # A callable returning extract_local's result for image, or None. The
+    # photo is read on the first call only, so text_check and try_local can
+    # share one read of the same scan.
+    def reader(self, image):
+        read = []
+
+        def result():
+            if not read:
+                with METRICS.span("local_extract"):
+                    try:
+                        read.append(extract_local(image, self.known_keys()))
+                    except Exception:
+                        read.append(None)  # a broken OCR install must never block scanning
+            return read[0]
+
+        return result
+
+    # Whether a local read is clean enough to stand in for Gemini
+    def accepts(self, result):
+        ingredients, confidence, coverage = result
+        return bool(ingredients) and confidence >= self.min_confidence and coverage >= self.min_coverage
+
+    # The locally read ingredients, or None when Gemini should take the scan.
+    # read: a reader() already used for this photo, if any.
+    def try_local(self, image, read=None):
+        result = (read or self.reader(image))()
+        if result is None:
+            with self._lock:
+                self.unavailable += 1
+            METRICS.inc("cascade_unavailable")
+            return None
+
+        ingredients, confidence, coverage = result
+        accepted = self.accepts(result)
+        with self._lock:
+            self._samples.append((confidence, coverage, bool(ingredients)))
+            if accepted:
+                self.local += 1
+            else:
+                self.gemini += 1
+        METRICS.inc("cascade_local" if accepted else "cascade_gemini")
+        return ingredients if accepted else None
+
+    # A confirm callable for ProductRegistry.lookup. A stored product is
+    # confirmed only when the photo's local read (a reader(), shared with
+    # try_local) is one try_local would accept and names exactly the same
+    # Haram and Syubhah ingredients as the stored scan. check(ingredients)
+    # -> (status, details). Without an OCR engine nothing is confirmed, so
+    # nothing is reused.
+    def text_check(self, read, check):
+        confirmed = {}
+
+        def flagged(ingredients):
+            _, details = check(ingredients)
+            return ({d["name"] for d in details if d["status"] in FLAGGED},
+                    any(d["status"] == "Unknown" for d in details))
+
+        def confirm(detected):
+            if "flagged" not in confirmed:
+                confirmed["flagged"] = None
+                result = read()
+                if result is not None and self.accepts(result):
+                    with METRICS.span("product_confirm"):
+                        names, unknown = flagged(result[0])
+                    if not unknown:
+                        confirmed["flagged"] = names
+            return confirmed["flagged"] is not None and flagged(detected)[0] == confirmed["flagged"]
+
+        return confirm
+
+    def threshold_sweep(self):
+        with self._lock:
+            samples = list(self._samples)
+        if not samples:
+            return {}
+        return {threshold: sum(1 for conf, cov, found in samples
+                               if found and conf >= threshold and cov >= self.min_coverage) / len(samples)
+                for threshold in SWEEP}
+
+    def stats(self):
+        with self._lock:
+            total = self.local + self.gemini + self.unavailable
+            counts = {"local": self.local, "gemini": self.gemini, "ocr_unavailable": self.unavailable}
+        rates = {f"{tier}_rate": count / total if total else 0.0 for tier, count in counts.items()}
+        return {**counts, **rates, "min_confidence": self.min_confidence,
+                "local_rate_by_threshold": self.threshold_sweep()}
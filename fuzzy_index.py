@@ -0,0 +1,109 @@
+import heapq
+from collections import defaultdict
+
+# Characters OCR mixes up; swapping one for its twin costs a quarter edit
+OCR_CONFUSIONS = (("0", "O"), ("1", "I"), ("1", "L"), ("I", "L"), ("5", "S"), ("8", "B"), ("2", "Z"), ("6", "G"))
+CONFUSION_COST = 0.25
+MIN_CONFIDENCE = 0.8
+WORD_LETTERS_PER_EDIT = 8  # a word gets one full edit per this many letters; shorter words get none
+MAX_CANDIDATES = 5  # spellings sharing the most trigrams that get a full edit-distance check
+
+# The distance is computed in integer units of one confusion
+_EDIT = round(1 / CONFUSION_COST)
+_CONFUSABLE = {pair for a, b in OCR_CONFUSIONS for pair in ((a, b), (b, a))}
+
+
+# Levenshtein distance with cheaper OCR substitutions. Only cells within
+# max_distance of the diagonal are filled, and the scan stops as soon as a
+# whole row is over the limit; returns None in that case.
+def edit_distance(a, b, max_distance):
+    # Small epsilon so 0.2 * 5 letters still allows one full edit
+    limit = int(max_distance * _EDIT + 1e-9)
+    band = int(max_distance + 1e-9)
+    inf = limit + 1
+    previous = [j * _EDIT if j <= band else inf for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        lo, hi = max(1, i - band), min(len(b), i + band)
+        current = [inf] * (len(b) + 1)
+        if i <= band:
+            current[0] = i * _EDIT
+        row_min = current[0]
+        for j in range(lo, hi + 1):
+            cb = b[j - 1]
+            if ca == cb:
+                cost = previous[j - 1]
+            else:
+                cost = previous[j - 1] + (1 if (ca, cb) in _CONFUSABLE else _EDIT)
+            cost = min(cost, previous[j] + _EDIT, current[j - 1] + _EDIT)
+            current[j] = cost
+            if cost < row_min:
+                row_min = cost
+        if row_min > limit:
+            return None
+        previous = current
+    return previous[-1] / _EDIT if previous[-1] <= limit else None
+
+
+# True when b is a copy of a with only OCR lookalikes swapped ("E47L" / "E471")
+def ocr_variant(a, b):
+    return len(a) == len(b) and all(x == y or (x, y) in _CONFUSABLE for x, y in zip(a, b))
+
+
+# True when two words are the same word misread: lookalike swaps, a letter
+# missing or added at either end ("Carmin", "Gelatine"), and one full edit
+# per WORD_LETTERS_PER_EDIT letters. Anything closer to a different word
+# ("Insulin" / "Inulin") is not.
+def close_word(a, b):
+    if len(a) < len(b):
+        a, b = b, a
+    if len(a) - len(b) == 1 and len(b) >= 4 and (ocr_variant(a[:-1], b) or ocr_variant(a[1:], b)):
+        return True
+    # The extra half lets two lookalike swaps through on top
+    return edit_distance(a, b, len(a) // WORD_LETTERS_PER_EDIT + 2 * CONFUSION_COST) is not None
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# --- FUZZY MATCH INDEX ---
+# Trigram index over a fixed set of spellings ({spelling: value}). A query
+# first ranks spellings by shared trigrams, then runs the edit distance on
+# the few best only, so lookups stay well under a millisecond. Confidence is
+# 1 - distance / length of the longer string.
+class FuzzyIndex:
+    def __init__(self, spellings):
+        self._values = dict(spellings)
+        self._postings = defaultdict(list)
+        for spelling in self._values:
+            for gram in trigrams(spelling):
+                self._postings[gram].append(spelling)
+
+    # Returns (value, spelling, confidence) for the closest spelling, or None
+    # if nothing reaches min_confidence
+    def best(self, text, min_confidence=MIN_CONFIDENCE, max_candidates=MAX_CANDIDATES):
+        if not text:
+            return None
+        if text in self._values:
+            return self._values[text], text, 1.0
+
+        shared = defaultdict(int)
+        for gram in trigrams(text):
+            for spelling in self._postings.get(gram, ()):
+                shared[spelling] += 1
+        ranked = heapq.nlargest(max_candidates, shared, key=shared.__getitem__)
+
+        best = None
+        for spelling in ranked:
+            longest = max(len(text), len(spelling))
+            max_distance = (1 - min_confidence) * longest
+            if abs(len(text) - len(spelling)) > max_distance:
+                continue
+            distance = edit_distance(text, spelling, max_distance)
+            if distance is None:
+                continue
+            confidence = 1 - distance / longest
+            if best is None or confidence > best[2]:
+                best = (self._values[spelling], spelling, confidence)
+        return best
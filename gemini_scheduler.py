@@ -0,0 +1,203 @@
+import hashlib
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import METRICS
+
+GEMINI_RPM = 15    # requests per minute allowed by our quota
+GEMINI_BURST = 3   # requests that may go out back-to-back before throttling
+MAX_RETRIES = 4
+BASE_DELAY = 1.0   # seconds; doubled on each retry, with jitter
+MAX_DELAY = 30.0
+
+
+# 429 and 5xx responses are worth retrying; anything else is a real error.
+# google.api_core is already loaded by the time a call fails, so importing it
+# here keeps it off the startup path.
+def is_retryable(error):
+    from google.api_core import exceptions as google_exceptions
+    return isinstance(error, (google_exceptions.TooManyRequests, google_exceptions.ServerError))
+
+
+# --- TOKEN BUCKET ---
+# reserve() always takes a token, letting the balance go negative, and returns
+# how long the caller has to wait for it. Callers are served in arrival order.
+class TokenBucket:
+    def __init__(self, rate_per_minute, capacity):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self):
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def estimated_wait(self):
+        with self._lock:
+            self._refill()
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+
+# Identical prompt + image parts produce the same key
+def request_key(contents):
+    digest = hashlib.sha256()
+    for part in contents:
+        if isinstance(part, str):
+            digest.update(part.encode())
+        elif isinstance(part, dict) and "data" in part:
+            digest.update(part["data"])
+        elif hasattr(part, "tobytes"):
+            digest.update(part.tobytes())
+        else:
+            return None
+    return digest.hexdigest()
+
+
+# --- GEMINI SCHEDULER ---
+# Process-wide front for model.generate_content with the same call signature:
+# every request waits for a token-bucket slot, 429/5xx responses are retried
+# with jittered exponential backoff, and identical requests already in flight
+# share one call. Streaming calls are throttled and retried until the first
+# chunk arrives, but not coalesced.
+class GeminiScheduler:
+    def __init__(self, model, rpm=GEMINI_RPM, burst=GEMINI_BURST, max_retries=MAX_RETRIES,
+                 base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+        self.model = model
+        self.bucket = TokenBucket(rpm, burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.calls = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.failures = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _throttle(self):
+        wait = self.bucket.reserve()
+        METRICS.observe("gemini_queue", wait)
+        if wait <= 0:
+            return
+        with self._lock:
+            self.queued += 1
+        try:
+            time.sleep(wait)
+        finally:
+            with self._lock:
+                self.queued -= 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+
+    def _backoff(self, attempt):
+        with self._lock:
+            self.retries += 1
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        time.sleep(delay * random.uniform(0.5, 1.0))
+
+    def _call(self, contents, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            self._throttle()
+            with self._lock:
+                self.calls += 1
+            try:
+                with METRICS.span("gemini_call"):
+                    response = self.model.generate_content(contents, **kwargs)
+                METRICS.record_usage(response)
+                return response
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                if attempt == self.max_retries:
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                self._backoff(attempt)
+
+    def _stream(self, contents, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            self._throttle()
+            with self._lock:
+                self.calls += 1
+            try:
+                chunks = iter(self.model.generate_content(contents, stream=True, **kwargs))
+                first = next(chunks, None)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                if attempt == self.max_retries:
+                    with self._lock:
+                        self.failures += 1
+                    raise
+                self._backoff(attempt)
+                continue
+            # The last chunk carries the usage totals for the whole stream
+            last = first
+            if first is not None:
+                yield first
+            for chunk in chunks:
+                last = chunk
+                yield chunk
+            METRICS.record_usage(last)
+            return
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        if stream:
+            return self._stream(contents, **kwargs)
+
+        key = request_key(contents)
+        if key is None:
+            return self._call(contents, **kwargs)
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            response = self._call(contents, **kwargs)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def estimated_wait(self):
+        return self.bucket.estimated_wait()
+
+    def stats(self):
+        with self._lock:
+            waited = self.calls or 1
+            return {
+                "queue_depth": self.queued,
+                "in_flight": len(self._inflight),
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "retries": self.retries,
+                "failures": self.failures,
+                "avg_wait_s": round(self.total_wait / waited, 2),
+                "max_wait_s": round(self.max_wait, 2),
+            }
@@ -0,0 +1,163 @@
+import io
+import math
+
+from PIL import Image, ImageFilter, ImageOps
+
+MAX_EDGE = 1600       # longest side sent to Gemini, in pixels
+OUTPUT_FORMAT = "JPEG"  # or "WEBP"
+OUTPUT_QUALITY = 85
+CROP_MARGIN = 0.04    # padding kept around the detected text region (fraction of each side)
+MIN_CROP_AREA = 0.10  # never crop to less than this fraction of the image
+TILE_GAP = 16         # white pixels between panels on a tiled canvas
+# Off until recall on labelled photos shows the crop never cuts sparse list
+# lines; benchmarks/bench_image_prep.py measures it
+CROP_TEXT = False
+MAX_DECODE_PIXELS = 12_000_000  # bigger photos are decoded at a smaller size (~36 MB as RGB)
+DISPLAY_EDGE = 720    # longest side of the on-screen preview
+PREVIEW_QUALITY = 80
+
+
+# --- BOUNDED DECODING ---
+# Opens a photo (bytes or file object) with at most max_pixels decoded
+# pixels. JPEGs are decoded straight at 1/2, 1/4 or 1/8 scale (draft mode),
+# so a 48 MP phone photo never allocates its full-resolution bitmap; other
+# formats are decoded, then shrunk.
+def decode_image(source, max_pixels=MAX_DECODE_PIXELS):
+    image = Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+    width, height = image.size
+    reduce = 1
+    while width * height / (reduce * reduce) > max_pixels and reduce < 8:
+        reduce *= 2
+    if reduce > 1:
+        image.draft("RGB", (width // reduce, height // reduce))
+    image.load()
+    if image.width * image.height > max_pixels:
+        scale = math.sqrt(max_pixels / (image.width * image.height))
+        image.thumbnail((int(image.width * scale), int(image.height * scale)), Image.BILINEAR)
+    return image
+
+
+# A small upright JPEG for showing the upload, instead of handing the
+# full-resolution photo to st.image
+def preview_jpeg(source, edge=DISPLAY_EDGE):
+    image = Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+    image.draft("RGB", (edge, edge))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((edge, edge), Image.LANCZOS)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=PREVIEW_QUALITY)
+    return buffer.getvalue()
+
+
+# --- TEXT REGION DETECTION ---
+# Printed text is dense in edges. Project an edge map onto both axes and keep
+# the rows/columns whose edge density is well above the image average. Works
+# on a small copy so it costs a few milliseconds even for large photos.
+def find_text_box(image, probe_edge=800):
+    probe = image.convert("L")
+    probe.thumbnail((probe_edge, probe_edge))
+    edges = ImageOps.autocontrast(probe.filter(ImageFilter.FIND_EDGES)).point(lambda v: 255 if v > 64 else 0)
+    # FIND_EDGES lights up the outermost pixels; blank them so borders never count as text
+    border = 2
+    edges = ImageOps.expand(edges.crop((border, border, edges.width - border, edges.height - border)), border, 0)
+    width, height = edges.size
+
+    # Box-resampling to a single column/row averages each row/column for us
+    row_density = [v / 255 for v in edges.resize((1, height), Image.BOX).tobytes()]
+    col_density = [v / 255 for v in edges.resize((width, 1), Image.BOX).tobytes()]
+
+    def span(density):
+        threshold = max(sum(density) / len(density), 0.02)
+        active = [i for i, d in enumerate(density) if d >= threshold]
+        if not active:
+            return 0, len(density)
+        return active[0], active[-1] + 1
+
+    top, bottom = span(row_density)
+    left, right = span(col_density)
+
+    scale_x = image.width / width
+    scale_y = image.height / height
+    pad_x = int(image.width * CROP_MARGIN)
+    pad_y = int(image.height * CROP_MARGIN)
+    box = (max(0, int(left * scale_x) - pad_x),
+           max(0, int(top * scale_y) - pad_y),
+           min(image.width, int(right * scale_x) + pad_x),
+           min(image.height, int(bottom * scale_y) + pad_y))
+
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    if area < MIN_CROP_AREA * image.width * image.height or box == (0, 0, image.width, image.height):
+        return None
+    return box
+
+
+# --- PREPROCESSING PIPELINE ---
+# EXIF rotation -> text crop (opt-in) -> downscale -> optional grayscale/contrast ->
+# compact re-encode. Returns the Gemini blob, the processed image and the
+# byte counts so the UI can report the saving.
+def prepare_image(image, original_size=None, max_edge=MAX_EDGE, grayscale=False, normalize_contrast=False,
+                  crop_text=CROP_TEXT, output_format=OUTPUT_FORMAT, quality=OUTPUT_QUALITY):
+    image = ImageOps.exif_transpose(image)
+
+    if crop_text:
+        box = find_text_box(image)
+        if box:
+            image = image.crop(box)
+
+    if max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    if grayscale:
+        image = image.convert("L")
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    if normalize_contrast:
+        image = ImageOps.autocontrast(image, cutoff=1)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=output_format, quality=quality, optimize=True)
+    data = buffer.getvalue()
+
+    stats = {
+        "original_bytes": original_size,
+        "prepared_bytes": len(data),
+        "saved_bytes": original_size - len(data) if original_size else None,
+        "size": image.size,
+    }
+    blob = {"mime_type": f"image/{output_format.lower()}", "data": data}
+    return blob, image, stats
+
+
+# --- PANEL TILING ---
+# Several photos of one package on a single white canvas no larger than
+# max_edge, so they go to Gemini as one image. Each panel is rotated and
+# cropped to its text first; portrait panels sit side by side, landscape
+# ones are stacked.
+def tile_images(images, max_edge=MAX_EDGE, crop_text=CROP_TEXT):
+    panels = []
+    for image in images:
+        image = ImageOps.exif_transpose(image)
+        if crop_text:
+            box = find_text_box(image)
+            if box:
+                image = image.crop(box)
+        panels.append(image.convert("RGB"))
+
+    across = math.ceil(math.sqrt(len(panels)))
+    down = math.ceil(len(panels) / across)
+    if sum(p.width for p in panels) > sum(p.height for p in panels):
+        across, down = down, across
+    cell_w = (max_edge - TILE_GAP * (across - 1)) // across
+    cell_h = (max_edge - TILE_GAP * (down - 1)) // down
+
+    canvas = Image.new("RGB", (across * cell_w + TILE_GAP * (across - 1), down * cell_h + TILE_GAP * (down - 1)),
+                       (255, 255, 255))
+    for i, panel in enumerate(panels):
+        panel.thumbnail((cell_w, cell_h), Image.LANCZOS)
+        x = (i % across) * (cell_w + TILE_GAP) + (cell_w - panel.width) // 2
+        y = (i // across) * (cell_h + TILE_GAP) + (cell_h - panel.height) // 2
+        canvas.paste(panel, (x, y))
+    return canvas
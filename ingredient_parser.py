@@ -0,0 +1,166 @@
+import re
+
+from scanner import CODE_INDEX, choose_entry, compact_name
+
+# --- LOCAL INGREDIENT PARSER ---
+# Turns a pasted ingredient list into the same [{"code", "context"}] shape that
+# Gemini returns, so it can go straight into check_database without an AI call.
+
+LEADING_LABEL_RE = re.compile(r"^\s*(ingredients?|ingredien|bahan-bahan|bahan|kandungan|contains)\s*[:\-]\s*", re.I)
+# "471(i)" / "150 (a)" -> "471i" / "150a" so suffixes never look like a nested list
+SUFFIX_RE = re.compile(r"(\d{3,4})\s*\(\s*(iv|v|i{1,3}|[a-f])\s*\)", re.I)
+CODE_RE = re.compile(r"\b(E|INS)\s*[-.]?\s*(\d{3,4})(iv|v|i{1,3}|[a-f])?\b", re.I)
+BARE_CODE_RE = re.compile(r"^(\d{3,4})(iv|v|i{1,3}|[a-f])?$", re.I)
+# "Colour: 120", "Emulsifier 471i": an INS number after its class name
+CLASS_CODE_RE = re.compile(r"^([a-z][a-z' -]*?)\s*:?\s*(\d{3,4})(iv|v|i{1,3}|[a-f])?$", re.I)
+PERCENT_RE = re.compile(r"\d+(?:[.,]\d+)?\s*%")
+MAX_NAME_WORDS = 4
+
+
+def _clean(text):
+    text = PERCENT_RE.sub("", text)
+    text = re.sub(r"[()\[\]{}]", " ", text)
+    return re.sub(r"\s+", " ", text).strip(" ,;:.-")
+
+
+# Splits on commas/semicolons that are not inside brackets
+def split_top_level(text, separators=",;"):
+    parts, depth, current = [], 0, []
+    for ch in text:
+        if ch in "([{":
+            depth += 1
+        elif ch in ")]}":
+            depth = max(0, depth - 1)
+        if ch in separators and depth == 0:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(ch)
+    parts.append("".join(current))
+    return [p.strip() for p in parts if p.strip()]
+
+
+# Returns the text outside brackets and the contents of each top-level group
+def split_groups(text):
+    outer, groups, depth, current = [], [], 0, []
+    for ch in text:
+        if ch in "([{":
+            if depth > 0:
+                current.append(ch)
+            depth += 1
+        elif ch in ")]}" and depth > 0:
+            depth -= 1
+            if depth == 0:
+                groups.append("".join(current))
+                current = []
+            else:
+                current.append(ch)
+        elif depth > 0:
+            current.append(ch)
+        else:
+            outer.append(ch)
+    if current:
+        groups.append("".join(current))
+    return "".join(outer).strip(), [g.strip() for g in groups if g.strip()]
+
+
+def _format_code(prefix, digits, suffix):
+    code = f"{prefix.upper()} {digits}" if prefix.upper() == "INS" else f"E{digits}"
+    if not suffix:
+        return code
+    # Letters attach directly (E150a); roman numerals keep brackets (E471(i))
+    suffix = suffix.lower()
+    return f"{code}{suffix}" if len(suffix) == 1 and suffix not in "iv" else f"{code}({suffix})"
+
+
+# The run of words naming a known database key, chosen among all such runs
+# by the alias rule (scanner.choose_entry): "Soy Lecithin" -> "Lecithin",
+# "Pork Gelatin" -> "Pork", "Cocoa Butter" -> None
+def _match_name(words, known_keys):
+    spans = []
+    for size in range(min(MAX_NAME_WORDS, len(words)), 0, -1):
+        for start in range(len(words) - size + 1):
+            compact = compact_name(" ".join(words[start:start + size]))
+            if compact in known_keys:
+                spans.append((start, start + size - 1, CODE_INDEX.get(compact, compact)))
+    best = choose_entry(words, spans)
+    return " ".join(words[best[0]:best[1] + 1]) if best else None
+
+
+def _looks_like_ingredient(text, known_keys):
+    text = text.strip()
+    if CODE_RE.search(text) or BARE_CODE_RE.match(text) or CLASS_CODE_RE.match(text):
+        return True
+    return known_keys is not None and _match_name(_clean(text).split(), known_keys) is not None
+
+
+def _parse_item(item, parent, known_keys, out, in_list):
+    outer, groups = split_groups(item)
+
+    codes = list(CODE_RE.finditer(outer))
+    # A number alone counts inside a list ("Emulsifiers (471, 322)"); at the
+    # top level it needs its class name, which becomes the context
+    bare, label = None, ""
+    if not codes:
+        m = BARE_CODE_RE.match(outer.replace(" ", "")) if in_list else None
+        if m:
+            bare = m.groups()
+        else:
+            m = CLASS_CODE_RE.match(outer)
+            if m:
+                label, bare = m.group(1), m.group(2, 3)
+
+    # Groups that hold their own ingredients ("Emulsifiers (E471, E322)",
+    # "Gelling Agents (Gelatine, Pectin)") are parsed as children; anything
+    # else ("vegetable origin", "12%") is context. Once the item has its own
+    # code, only further codes count as children, so "E471 (soy)" keeps "soy"
+    # as context.
+    list_groups, context_groups = [], []
+    for group in groups:
+        parts = split_top_level(group)
+        if codes or bare:
+            is_list = any(_looks_like_ingredient(p, None) for p in parts)
+        else:
+            is_list = len(parts) > 1 or any(_looks_like_ingredient(p, known_keys) for p in parts)
+        if is_list:
+            list_groups.append(parts)
+        else:
+            context_groups.append(group)
+
+    if codes or bare:
+        rest = CODE_RE.sub(" ", outer) if codes else label
+        context = _clean(" ".join([parent, rest] + context_groups))
+        if codes:
+            for m in codes:
+                out.append({"code": _format_code(m.group(1), m.group(2), m.group(3)), "context": context})
+        else:
+            out.append({"code": _format_code("E", *bare), "context": context})
+    elif outer:
+        words = _clean(outer).split()
+        name = " ".join(words)
+        if known_keys is not None:
+            name = _match_name(words, known_keys) or name
+        if name and not list_groups:
+            own = _clean(outer) if _clean(outer).upper() != name.upper() else ""
+            context = _clean(" ".join([parent, own] + context_groups))
+            out.append({"code": name, "context": context})
+
+    for parts in list_groups:
+        label = _clean(outer) or parent
+        for part in parts:
+            _parse_item(part, label, known_keys, out, in_list=True)
+
+
+# known_keys: ecodes document ids. A named item is cut down to the longest
+# run of words that is one ("Beef Gelatin Powder" -> "Gelatin"); items that
+# match none are kept whole, so check_ingredients can still resolve them
+# fuzzily or show them as Unknown.
+def parse_ingredient_text(text, known_keys=None):
+    text = LEADING_LABEL_RE.sub("", text.strip())
+    text = SUFFIX_RE.sub(r"\1\2", text).replace("\n", ", ")
+    text = text.rstrip(". ")
+
+    results = []
+    for item in split_top_level(text):
+        _parse_item(item, "", known_keys, results, in_list=False)
+    return results
@@ -0,0 +1,93 @@
+import re
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+# --- MULTI-PATTERN KEYWORD MATCHER ---
+# Aho-Corasick automaton over word tokens. Every pattern (one or more words)
+# is compiled once; find() then walks the text's tokens a single time and
+# reports every pattern that occurs as whole words, however many patterns
+# there are ("oil" matches "Palm Oil" but not "boiled").
+class KeywordMatcher:
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._built = False
+
+    def add(self, pattern, value):
+        words = TOKEN_RE.findall(pattern.lower())
+        if not words:
+            return
+        node = 0
+        for word in words:
+            nxt = self._goto[node].get(word)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][word] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append(value)
+        self._built = False
+
+    def build(self):
+        # Breadth-first pass to set failure links and merge outputs
+        queue = list(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for word, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and word not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(word, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+        self._built = True
+        return self
+
+    def find(self, text):
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        root = goto[0]
+        found = []
+        node = 0
+        for word in TOKEN_RE.findall(text.lower()):
+            if node == 0:
+                # Fast path: most words never start a pattern
+                node = root.get(word, 0)
+            else:
+                while node and word not in goto[node]:
+                    node = fail[node]
+                node = goto[node].get(word, 0)
+            if node and out[node]:
+                found.extend(out[node])
+        return found
+
+    # find() over already tokenized words (TOKEN_RE on the lowered text),
+    # with the index of the word each match ends on: [(end, value)]. Values
+    # that carry their pattern's word count give back the whole span.
+    def find_ends(self, words):
+        if not self._built:
+            self.build()
+        goto, fail, out = self._goto, self._fail, self._out
+        root = goto[0]
+        found = []
+        node = 0
+        for end, word in enumerate(words):
+            if node == 0:
+                node = root.get(word, 0)
+            else:
+                while node and word not in goto[node]:
+                    node = fail[node]
+                node = goto[node].get(word, 0)
+            if node and out[node]:
+                found.extend((end, value) for value in out[node])
+        return found
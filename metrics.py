@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Seconds; the same buckets for every stage so histograms line up
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+WINDOW = 1000  # recent samples per histogram kept for percentiles
+METRIC_PREFIX = "halai_"
+
+
+# --- HISTOGRAM ---
+# Cumulative Prometheus-style buckets plus a sliding window of recent
+# samples, so the debug panel can show exact p50/p95/p99 of recent scans.
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS, window=WINDOW):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def percentile(self, q):
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# --- METRICS REGISTRY ---
+# Process-wide latency histograms and counters. Stages are timed with
+#
+#     with METRICS.span("gemini"):
+#         ...
+#
+# and exported in the Prometheus text format by render_prometheus().
+class Metrics:
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    # Wraps fn so every call is observed under `name`
+    def timed(self, name, fn):
+        def wrapper(*args, **kwargs):
+            with self.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    # Gemini token counts from a response's usage_metadata, when present
+    def record_usage(self, response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        for field, name in (("prompt_token_count", "gemini_prompt_tokens"),
+                            ("candidates_token_count", "gemini_output_tokens"),
+                            ("total_token_count", "gemini_total_tokens")):
+            value = getattr(usage, field, None)
+            if value:
+                self.inc(name, value)
+
+    # {stage: {"count", "p50", "p95", "p99", "mean"}} in milliseconds
+    def summary(self):
+        with self._lock:
+            rows = {}
+            for name, h in sorted(self._histograms.items()):
+                rows[name] = {
+                    "count": h.count,
+                    "p50": h.percentile(0.50) * 1000,
+                    "p95": h.percentile(0.95) * 1000,
+                    "p99": h.percentile(0.99) * 1000,
+                    "mean": h.sum / h.count * 1000,
+                }
+            return rows
+
+    def counters(self):
+        with self._lock:
+            return dict(sorted(self._counters.items()))
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            if self._histograms:
+                metric = f"{METRIC_PREFIX}stage_seconds"
+                lines.append(f"# HELP {metric} Latency of each scan stage.")
+                lines.append(f"# TYPE {metric} histogram")
+                for name, h in sorted(self._histograms.items()):
+                    cumulative = 0
+                    for bound, count in zip(h.buckets, h.bucket_counts):
+                        cumulative += count
+                        lines.append(f'{metric}_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{metric}_bucket{{stage="{name}",le="+Inf"}} {h.count}')
+                    lines.append(f'{metric}_sum{{stage="{name}"}} {h.sum:.6f}')
+                    lines.append(f'{metric}_count{{stage="{name}"}} {h.count}')
+            for name, value in sorted(self._counters.items()):
+                metric = f"{METRIC_PREFIX}{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
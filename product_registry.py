@@ -0,0 +1,177 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from PIL import Image, ImageOps
+
+HASH_SIZE = 8         # gradient grid; rows and columns give 2 * 8 * 9 = 144 bits
+HASH_BITS = 2 * HASH_SIZE * (HASH_SIZE + 1)
+MAX_DISTANCE = 12     # differing bits for two photos to count as the same product
+MAX_ENTRIES = 5000    # products kept before LRU eviction
+TTL = 7 * 24 * 3600   # seconds a product's verdict is reused
+MIN_DETAIL = 16       # set bits below which a photo is too flat (blank, dark, blurred) to identify
+
+
+# --- PERCEPTUAL HASH ---
+# dHash over both axes: the photo is shrunk to a (size + 1) square of grey
+# levels and every bit says whether a pixel is brighter than its right (or
+# lower) neighbour. Small changes in angle, lighting, crop and JPEG quality
+# flip only a few bits, unlike a hash of the bytes.
+def dhash(image, hash_size=HASH_SIZE):
+    image = ImageOps.exif_transpose(image)
+    side = hash_size + 1
+    pixels = image.resize((side, side), Image.BOX).convert("L").tobytes()
+    value = 0
+    for row in range(side):
+        for col in range(side):
+            here = pixels[row * side + col]
+            if col < hash_size:
+                value = (value << 1) | (here > pixels[row * side + col + 1])
+            if row < hash_size:
+                value = (value << 1) | (here > pixels[(row + 1) * side + col])
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+# --- MULTI-INDEX HASHING ---
+# Hamming-distance search by the pigeonhole principle: the hash is cut into
+# max_distance + 1 blocks, so two hashes within max_distance agree exactly
+# on at least one block. Each block has its own exact-match table; a search
+# checks the full distance only for items sharing a block. (A BK-tree needs
+# a near-linear scan at this radius on 144-bit hashes.)
+class MultiIndexHash:
+    def __init__(self, bits, max_distance):
+        self.max_distance = max_distance
+        blocks = max_distance + 1
+        edges = [bits * i // blocks for i in range(blocks + 1)]
+        self._blocks = [(lo, (1 << (hi - lo)) - 1) for lo, hi in zip(edges, edges[1:])]
+        self._tables = [defaultdict(list) for _ in self._blocks]
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        for table, (shift, mask) in zip(self._tables, self._blocks):
+            table[(value >> shift) & mask].append((value, item))
+
+    # [(distance, item)] for every item within radius (<= max_distance)
+    def search(self, value, radius):
+        found = {}
+        for table, (shift, mask) in zip(self._tables, self._blocks):
+            for other, item in table.get((value >> shift) & mask, ()):
+                if item not in found:
+                    distance = hamming(value, other)
+                    if distance <= radius:
+                        found[item] = distance
+        return [(distance, item) for item, distance in found.items()]
+
+
+# --- PRODUCT REGISTRY ---
+# Finished verdicts by perceptual hash of the label photo, shared by every
+# user: a new photo of a product someone already scanned gets its verdict
+# back without a Gemini call. The extracted ingredients are kept with the
+# verdict, so after the ecodes data changes (data_version, as in
+# verdict_cache.py) the caller can re-check them instead of re-scanning.
+#
+# The hash only finds candidates. It sees the pack design, not the text, so
+# two recipes in the same packaging hash alike; lookup() reuses a product
+# only when confirm(detected) agrees that the new photo's own text names the
+# same ingredients (see ExtractionCascade.text_check).
+#
+# Evicted products stay in the index until it is rebuilt; searches skip them.
+class ProductRegistry:
+    def __init__(self, data_version, max_distance=MAX_DISTANCE, max_entries=MAX_ENTRIES, ttl=TTL):
+        self.data_version = data_version
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.unconfirmed = 0
+        self._entries = OrderedDict()  # id -> record
+        self._index = MultiIndexHash(HASH_BITS, max_distance)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    # The closest live product within max_distance that confirm(detected)
+    # accepts, or None. Returns a dict with id, distance, detected and
+    # verdict ((status, details), or None when the data version has moved
+    # on since it was stored).
+    def lookup(self, image_hash, confirm):
+        now = time.monotonic()
+        with self._lock:
+            if not self.identifiable(image_hash):
+                self.misses += 1
+                return None
+            candidates = []
+            for distance, entry_id in self._index.search(image_hash, self.max_distance):
+                record = self._entries.get(entry_id)
+                if record is None:
+                    continue
+                if now - record["stored_at"] >= self.ttl:
+                    del self._entries[entry_id]
+                    continue
+                candidates.append((distance, entry_id, record))
+
+        # Confirming reads the photo, so it runs outside the lock
+        for distance, entry_id, record in sorted(candidates, key=lambda c: c[0]):
+            if confirm(list(record["detected"])):
+                break
+        else:
+            with self._lock:
+                self.misses += 1
+                self.unconfirmed += bool(candidates)
+            return None
+
+        with self._lock:
+            if entry_id in self._entries:
+                self._entries.move_to_end(entry_id)
+            record["hits"] += 1
+            self.hits += 1
+            verdict = None
+            if record["version"] is not None and record["version"] == self.data_version():
+                status, details = record["verdict"]
+                verdict = (status, [dict(d) for d in details])
+            return {"id": entry_id, "distance": distance, "hits": record["hits"],
+                    "detected": list(record["detected"]), "verdict": verdict}
+
+    @staticmethod
+    def identifiable(image_hash):
+        return hamming(image_hash, 0) >= MIN_DETAIL
+
+    # Returns the new product's id, or None if the photo is too flat to match
+    def add(self, image_hash, detected, status, details):
+        if not self.identifiable(image_hash):
+            return None
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = {
+                "hash": image_hash, "stored_at": time.monotonic(), "version": self.data_version(),
+                "detected": list(detected), "verdict": (status, [dict(d) for d in details]), "hits": 0,
+            }
+            self._index.add(image_hash, entry_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._maybe_rebuild()
+            return entry_id
+
+    # Drops a product, e.g. after a user rescanned it and got a new verdict
+    def remove(self, entry_id):
+        with self._lock:
+            self._entries.pop(entry_id, None)
+            self._maybe_rebuild()
+
+    def _maybe_rebuild(self):
+        if self._index.size > 2 * len(self._entries) + 64:
+            self._index = MultiIndexHash(HASH_BITS, self.max_distance)
+            for entry_id, record in self._entries.items():
+                self._index.add(record["hash"], entry_id)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"products": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "unconfirmed": self.unconfirmed, "hit_rate": self.hits / lookups if lookups else 0.0}
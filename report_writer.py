@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+REPORTS_COLLECTION = "reports"
+BATCH_SIZE = 50        # reports per batched write; a full batch flushes at once
+FLUSH_INTERVAL = 5.0   # seconds a report may wait for others before flushing
+MAX_BACKOFF = 300.0    # seconds between retries while Firestore keeps failing
+RECENT_KEYS = 1000     # written reports remembered for dedupe
+
+
+def report_key(item, notes):
+    canonical = json.dumps([" ".join(item.lower().split()), " ".join(notes.lower().split())], ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+# --- BUFFERED REPORT WRITER ---
+# submit() returns immediately; a background thread writes queued reports to
+# Firestore in batches, when BATCH_SIZE are waiting or FLUSH_INTERVAL has
+# passed. Every report is first appended to a local spool file (JSONL) and
+# only dropped from it once written, so reports survive restarts and
+# outages; failed flushes are retried with exponential backoff. Identical
+# (item, notes) pairs are written once, under their content hash as the
+# document id, which also makes a retried batch idempotent.
+class ReportWriter:
+    def __init__(self, db, spool_path=None, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.db = db
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.duplicates = 0
+        self.failures = 0
+        self._pending = {}  # key -> report, in arrival order
+        self._recent = {}   # keys already written, oldest first
+        self._oldest_at = None
+        self._backoff = 0.0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._spool_lock = threading.Lock()
+        self._load_spool()
+        self._thread = threading.Thread(target=self._run, name="report-writer", daemon=True)
+        self._thread.start()
+
+    # --- QUEUE ---
+    # Returns False if the same report is already queued or was just written
+    def submit(self, item, notes):
+        key = report_key(item, notes)
+        report = {"item": item, "notes": notes, "submitted_at": datetime.now(timezone.utc).isoformat()}
+        with self._cond:
+            if key in self._pending or key in self._recent:
+                self.duplicates += 1
+                return False
+            self._pending[key] = report
+            if self._oldest_at is None:
+                self._oldest_at = time.monotonic()
+            self._append_spool(key, report)
+            self._cond.notify()
+        return True
+
+    def _due(self):
+        if not self._pending:
+            return False
+        return (self._closed or len(self._pending) >= self.batch_size
+                or time.monotonic() - self._oldest_at >= self.flush_interval)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._due():
+                    if self._closed:
+                        return
+                    timeout = None
+                    if self._pending:
+                        timeout = max(0.0, self.flush_interval - (time.monotonic() - self._oldest_at))
+                    self._cond.wait(timeout)
+                batch = list(self._pending.items())[:self.batch_size]
+
+            if self._write(batch):
+                with self._cond:
+                    for key, _ in batch:
+                        self._pending.pop(key, None)
+                        self._recent[key] = True
+                    while len(self._recent) > RECENT_KEYS:
+                        del self._recent[next(iter(self._recent))]
+                    self._oldest_at = time.monotonic() if self._pending else None
+                    self.written += len(batch)
+                    self._backoff = 0.0
+                    self._rewrite_spool()
+            else:
+                with self._cond:
+                    self.failures += 1
+                    self._backoff = min(MAX_BACKOFF, max(1.0, self._backoff * 2))
+                    if self._closed:
+                        return  # still spooled; the next start sends it
+                    self._cond.wait(self._backoff)
+
+    def _write(self, batch):
+        try:
+            from firebase_admin import firestore
+
+            collection = self.db.collection(REPORTS_COLLECTION)
+            writes = self.db.batch()
+            for key, report in batch:
+                writes.set(collection.document(key), {
+                    "item": report["item"], "notes": report["notes"],
+                    "submitted_at": datetime.fromisoformat(report["submitted_at"]),
+                    "timestamp": firestore.SERVER_TIMESTAMP,
+                })
+            writes.commit()
+            return True
+        except Exception:
+            return False
+
+    # --- SPOOL FILE ---
+    def _load_spool(self):
+        if not self.spool_path or not os.path.exists(self.spool_path):
+            return
+        with open(self.spool_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from a crash
+                self._pending[record["key"]] = record["report"]
+        if self._pending:
+            self._oldest_at = time.monotonic()
+
+    def _append_spool(self, key, report):
+        if not self.spool_path:
+            return
+        with self._spool_lock:
+            try:
+                with open(self.spool_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"key": key, "report": report}, ensure_ascii=False) + "\n")
+            except OSError:
+                pass  # still queued in memory
+
+    def _rewrite_spool(self):
+        if not self.spool_path:
+            return
+        with self._spool_lock:
+            tmp_path = f"{self.spool_path}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    for key, report in self._pending.items():
+                        f.write(json.dumps({"key": key, "report": report}, ensure_ascii=False) + "\n")
+                os.replace(tmp_path, self.spool_path)
+            except OSError:
+                pass
+
+    # Flushes what is queued (one attempt) and stops the writer
+    def close(self, timeout=10.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            return {"queued": len(self._pending), "written": self.written,
+                    "duplicates": self.duplicates, "failures": self.failures}
@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+MAX_ENTRIES = 512        # in-memory results kept before LRU eviction
+MAX_DISK_ENTRIES = 5000  # files kept in the on-disk tier before eviction
+
+
+# --- IMAGE RESULT CACHE ---
+# Memoizes analyze_image output by a hash of the uploaded bytes plus the
+# prompt version, so re-scans and repeat uploads of the same photo skip
+# Gemini. Memory is a bounded LRU; the optional disk tier (one JSON file per
+# key) survives restarts.
+class ScanCache:
+    def __init__(self, max_entries=MAX_ENTRIES, disk_dir=None, max_disk_entries=MAX_DISK_ENTRIES):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(image_bytes, prompt_version):
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        return f"v{prompt_version}-{digest}"
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key), encoding="utf-8") as f:
+                    value = json.load(f)
+            except (OSError, ValueError):
+                value = None
+            if value is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, value)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.disk_dir:
+            self._write_disk(key, value)
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _write_disk(self, key, value):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+            self._trim_disk()
+        except OSError:
+            pass
+
+    def _trim_disk(self):
+        files = [os.path.join(self.disk_dir, n) for n in os.listdir(self.disk_dir) if n.endswith(".json")]
+        if len(files) <= self.max_disk_entries:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.max_disk_entries]:
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,497 @@
+import hashlib
+import json
+import re
+from contextlib import nullcontext
+
+from image_prep import MAX_EDGE, decode_image, prepare_image, tile_images
+from fuzzy_index import FuzzyIndex, close_word, ocr_variant
+from keyword_matcher import TOKEN_RE, KeywordMatcher
+from metrics import METRICS
+from scan_cache import ScanCache
+from seed import ecodes_data
+
+MODEL_NAME = 'gemini-2.5-flash-lite'
+
+# Bump PROMPT_VERSION whenever SCAN_PROMPT changes so cached results are not reused
+PROMPT_VERSION = 1
+SCAN_PROMPT = """
+    Analyze this food label image.
+    1. Identify ALL food additives, E-numbers (e.g., E120), INS numbers (e.g., INS 471), and suspicious ingredients (e.g., Gelatin, Lard, Emulsifiers).
+    2. If an ingredient is listed by name (e.g., "Citric Acid"), try to provide its E-number in the 'code' field (e.g., "E330").
+    3. Use context keywords (like "Vegetable", "Soy", "Animal") ONLY to fill the 'context' field. DO NOT list them as separate ingredients.
+    4. Return the result strictly as a JSON list of objects with keys: "code" (the E-number, INS number, or name) and "context" (the surrounding text indicating source).
+    5. Do not list the same ingredient twice.
+    6. Do not add markdown like ```json. Just the raw JSON.
+
+    Example Output: [{"code": "E471", "context": "Vegetable origin"}, {"code": "Gelatin", "context": ""}]
+    """
+
+# Several photos of one package in one request; see scan_panels()
+MAX_PANELS = 4  # photos per generate_content call; more are split over several calls
+PANELS_PROMPT = """
+    {layout} different panels of the SAME product's packaging. The ingredient list may
+    continue from one panel to the next: read them together as one label and list each ingredient once.
+    """
+
+
+def parse_ingredients(text_output):
+    text_output = text_output.replace("```json", "").replace("```", "").strip()
+    return json.loads(text_output)
+
+
+def extract_ingredients(model, image):
+    response = model.generate_content([SCAN_PROMPT, image])
+    return parse_ingredients(response.text)
+
+
+# One call for several panel images (or one tiled canvas of `count` panels)
+def extract_panels(model, images, count, tiled=False):
+    if count == 1:
+        return extract_ingredients(model, images[0])
+    layout = f"This image is a grid of {count} photos showing" if tiled else f"These {count} photos show"
+    response = model.generate_content([PANELS_PROMPT.format(layout=layout) + SCAN_PROMPT, *images])
+    return parse_ingredients(response.text)
+
+
+# --- STREAMING EXTRACTION ---
+# Pulls each {"code", "context"} object out of the JSON array as soon as its
+# closing brace arrives, so results can be shown before the model finishes.
+class IngredientStreamParser:
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._decoder = json.JSONDecoder()
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        items = []
+        while True:
+            start = self._buffer.find("{", self._pos)
+            if start == -1:
+                break
+            try:
+                obj, end = self._decoder.raw_decode(self._buffer, start)
+            except json.JSONDecodeError:
+                break  # object not complete yet; wait for the next chunk
+            self._pos = end
+            if isinstance(obj, dict):
+                items.append(obj)
+        return items
+
+    # Call once the stream has ended. Anything but the closing bracket left
+    # unparsed means an object was malformed and every ingredient after it is
+    # missing, so the scan must fail rather than pass as complete.
+    def close(self):
+        rest = self._buffer[self._pos:].replace("```json", "").replace("```", "")
+        if rest.strip(" \t\r\n[],"):
+            parse_ingredients(self._buffer)  # raises the same decode error as the one-shot path
+            raise ValueError(f"Unparsed model output: {rest.strip()[:80]!r}")
+
+
+def stream_ingredients(model, image):
+    response = model.generate_content([SCAN_PROMPT, image], stream=True)
+    parser = IngredientStreamParser()
+    for chunk in response:
+        yield from parser.feed(chunk.text)
+    parser.close()
+
+
+# --- INGREDIENT RULES ---
+IGNORE_KEYWORDS = {"VEGETABLE", "PLANT", "PLANTBASED", "SOY", "SYNTHETIC", "ANIMAL",
+                   "MINERAL", "FLAVOR", "COLOUR", "PRESERVATIVE", "INGREDIENTS", "CONTAINS"}
+SAFE_KEYWORDS = ("vegetable", "plant", "soy", "synthetic", "mineral", "vegan",
+                 "polyol", "gum", "cocoa", "fiber", "vanilla", "amino", "bcaa", "fermentation")
+SORT_PRIORITY = {"Haram": 1, "Syubhah": 2, "Unknown": 3, "Halal": 4}
+# What an additive does, not what it is ("Emulsifier Soy Lecithin"); a name
+# that only adds these words still names the entry
+ADDITIVE_CLASSES = {"EMULSIFIER", "STABILISER", "STABILIZER", "THICKENER", "COLOR", "COLOURING", "COLORING",
+                    "FLAVOUR", "FLAVOURING", "FLAVORING", "ANTIOXIDANT", "SWEETENER", "ACIDITY", "REGULATOR",
+                    "RAISING", "AGENT", "GELLING", "HUMECTANT", "ACIDULANT", "ENHANCER", "GLAZING"}
+E_NUMBER_RE = re.compile(r"^E\d{3}")
+
+
+# Aliases by name for every entry ("Lecithin", "Beef Gelatin" -> GELATIN),
+# compiled once at import; each carries its length in matcher tokens. Bare
+# keyword keys are left out: FLOUR and OIL name "Wheat Flour" and
+# "Vegetable Oil", and would otherwise claim "Rice Flour" and "Sunflower
+# Oil". Names split only on " / " ("Cochineal / Carmine"); a tight slash is
+# one name ("Sodium/Potassium Salts...").
+def build_alias_matcher():
+    matcher = KeywordMatcher()
+    for key, data in ecodes_data.items():
+        name = data.get("name", "")
+        for alias in {name, *name.split(" / "), *re.findall(r"\(([^)]+)\)", name)}:
+            if alias.strip():
+                matcher.add(alias, (key, len(TOKEN_RE.findall(alias.lower()))))
+    return matcher.build()
+
+
+ALIASES = build_alias_matcher()
+# "Pork-free", "alcohol free", "non-GMO": words that say what is NOT inside
+NEGATED_RE = re.compile(r"\b[\w']+[\s-]free\b|\bnon[\s-]?\w+", re.I)
+
+
+# Context and name are lowered into one haystack; each `in` is a C-level scan,
+# which beats any per-word Python loop for a keyword list this short
+def has_safe_keyword(*texts):
+    haystack = "\n".join(texts).lower()
+    return any(k in haystack for k in SAFE_KEYWORDS)
+
+
+# Sort rank of an entry when several are named in one ingredient: status
+# first (Haram, Syubhah, Unknown, Halal), then an E-number over a keyword
+# category ("Soy Lecithin" is E322, not SOY). Keys missing from the seed
+# data rank as Unknown.
+ENTRY_RANKS = {key: (SORT_PRIORITY.get(data.get("status"), SORT_PRIORITY["Unknown"]),
+                     not E_NUMBER_RE.match(data.get("code", "")))
+               for key, data in ecodes_data.items()}
+UNKNOWN_RANK = (SORT_PRIORITY["Unknown"], True)
+
+
+def entry_rank(key):
+    return ENTRY_RANKS.get(key, UNKNOWN_RANK)
+
+
+# Picks one of the (start, end, key) spans found over words, or None. The
+# most severe entry wins wherever it stands ("Pork Gelatin" -> PORK), then
+# the longer span. Words no span covers are read as Unknown, so a Halal
+# entry only stands when it names the whole ingredient ("Soy sauce" is not
+# SOY, "Cocoa Butter" is not dairy BUTTER); context words and additive
+# classes don't count.
+def choose_entry(words, spans):
+    if not spans:
+        return None
+    ranks = ENTRY_RANKS
+    rank, _, key, start, end = min((ranks.get(key, UNKNOWN_RANK), start - end, key, start, end)
+                                   for start, end, key in spans)
+    if rank[0] > SORT_PRIORITY["Unknown"]:
+        covered = {i for start, end, _ in spans for i in range(start, end + 1)}
+        for i, word in enumerate(words):
+            compact = compact_name(word)
+            if i not in covered and compact not in IGNORE_KEYWORDS and compact.rstrip("S") not in ADDITIVE_CLASSES:
+                return None
+    return start, end, key
+
+
+# The entry whose alias the text names, chosen by choose_entry, or None.
+# Negated words never match.
+def resolve_alias(text):
+    lowered = text.lower()
+    if "free" in lowered or "non" in lowered:
+        lowered = NEGATED_RE.sub(" ", lowered)
+    words = TOKEN_RE.findall(lowered)
+    spans = [(end - size + 1, end, key) for end, (key, size) in ALIASES.find_ends(words)]
+    best = choose_entry(words, spans)
+    return best[2] if best else None
+
+
+# --- CODE NORMALIZER ---
+# Uppercased codes go through one translate table (drop separators, spell out
+# "&") and one regex, so "E 471 (i)", "INS471i", "E-150a" and "471" all reach
+# their document key.
+CODE_TABLE = str.maketrans({" ": None, "-": None, ".": None, "_": None, "/": None, ",": None,
+                            "(": None, ")": None, "[": None, "]": None, "&": "AND", "+": "AND"})
+CODE_RE = re.compile(r"^(?:E|INS)?(\d{3,4})([A-H]?)(IV|VI{0,3}|I{1,3})?$")
+
+
+def compact_name(text):
+    return text.upper().translate(CODE_TABLE)
+
+
+# Every spelling of a name ("Sodium Benzoate", "Mono- and Diglycerides",
+# both halves of "Cochineal / Carmine", the "MSG" in "Monosodium Glutamate
+# (MSG)"). As for aliases, a tight slash is one name: "Sodium/Potassium
+# Salts..." must not make "Sodium" a spelling of E470a.
+def name_spellings(name):
+    spellings = [name] + name.split(" / ") + re.findall(r"\(([^)]+)\)", name) + [re.sub(r"\([^)]*\)", "", name)]
+    return [spelling for spelling in spellings if spelling.strip()]
+
+
+def compact_words(text):
+    return [word for word in map(compact_name, text.split()) if word]
+
+
+# Every document key plus every spelling of its name, built once from ecodes_data
+def build_code_index():
+    index = {}
+    for key, data in ecodes_data.items():
+        # Only real E-numbers: keyword entries use categories ("Fat", "Milk") as their code
+        code = compact_name(data.get("code", ""))
+        if CODE_RE.match(code):
+            index.setdefault(code, key)
+        for spelling in name_spellings(data.get("name", "")):
+            index.setdefault(compact_name(spelling), key)
+    # Document keys always resolve to themselves
+    index.update({key: key for key in ecodes_data})
+    return index
+
+
+CODE_INDEX = build_code_index()
+
+
+# --- FUZZY FALLBACK ---
+# For OCR near-misses ("Gelatine", "Carmin", "E47l") that miss every exact
+# lookup. Codes only match through lookalike swaps: one different digit is a
+# different additive, not a typo. Names are checked word by word
+# (fuzzy_index.close_word), so one close word can't carry a different one:
+# "Sodium Caseinate" is not Sodium Alginate.
+FUZZY_INDEX = FuzzyIndex(CODE_INDEX)
+CODE_LIKE_RE = re.compile(r"^(?:E|INS)?\d")
+SPELLING_WORDS = {compact_name(spelling): compact_words(spelling)
+                  for data in ecodes_data.values() for spelling in name_spellings(data.get("name", ""))}
+
+
+# (key, confidence) for the closest spelling in CODE_INDEX, or None
+def fuzzy_match(code_str):
+    compact = compact_name(code_str)
+    match = FUZZY_INDEX.best(compact)
+    if match is None:
+        return None
+    key, spelling, confidence = match
+    if CODE_LIKE_RE.match(compact):
+        return (key, confidence) if ocr_variant(compact, spelling) else None
+    if confidence < 1:
+        words, spelling_words = compact_words(code_str), SPELLING_WORDS.get(spelling, [spelling])
+        # Words run together ("SodiumBenzoat") are checked as one
+        if len(words) != len(spelling_words):
+            words, spelling_words = [compact], [spelling]
+        if not all(close_word(a, b) for a, b in zip(words, spelling_words)):
+            return None
+    return key, confidence
+
+
+# Returns the database key for a code as written on the label, or None if it
+# is only a context word
+def normalize_code(code_str):
+    compact = compact_name(code_str)
+    if compact in IGNORE_KEYWORDS:
+        return None
+    if compact in CODE_INDEX:
+        return CODE_INDEX[compact]
+
+    m = CODE_RE.match(compact)
+    if not m:
+        return compact
+    digits, letter, roman = m.groups()
+    # Most specific form first: E471I -> E471 when there is no (i) entry
+    for key in (f"E{digits}{letter}{roman or ''}", f"E{digits}{letter}", f"E{digits}"):
+        if key in CODE_INDEX:
+            return CODE_INDEX[key]
+    return f"E{digits}{letter}{roman or ''}"
+
+
+# Normalizes and dedupes Gemini output into (code_key, code_str, context) entries
+def collect_entries(ingredients, seen_codes=None):
+    seen_codes = set() if seen_codes is None else seen_codes
+    entries = []
+    for item_obj in ingredients:
+        code_str = item_obj.get("code", "").strip()
+        context = item_obj.get("context", "").strip()
+        if not code_str:
+            continue
+
+        code_key = normalize_code(code_str)
+        if code_key is None or code_key in seen_codes:
+            continue
+        seen_codes.add(code_key)
+        entries.append((code_key, code_str, context))
+    return entries
+
+
+# Joins the ingredient lists read from several panels of one product. Codes
+# are deduped by the same normalize_code key as collect_entries; a repeat
+# mention only fills in a context the first one lacked.
+def merge_ingredients(lists):
+    merged = {}
+    for ingredients in lists:
+        for item_obj in ingredients:
+            code_str = item_obj.get("code", "").strip()
+            code_key = normalize_code(code_str) if code_str else None
+            if code_key is None:
+                continue
+            if code_key not in merged:
+                merged[code_key] = dict(item_obj)
+            elif not merged[code_key].get("context", "").strip() and item_obj.get("context", "").strip():
+                merged[code_key]["context"] = item_obj["context"]
+    return list(merged.values())
+
+
+# Looks every entry up through get_many(keys) -> {key: data}. Codes that miss
+# fall back to the closest fuzzy spelling of the whole name, then to an alias
+# named inside it ("Beef Gelatin"); pass a dict as `matches` to collect
+# {code_key: (key, confidence)} for the fuzzy ones.
+def resolve_entries(entries, get_many, matches=None):
+    docs = get_many([code_key for code_key, _, _ in entries])
+    fallbacks = {}
+    fuzzy = {}
+    for code_key, code_str, _ in entries:
+        if docs.get(code_key) is None:
+            match = fuzzy_match(code_str)
+            if match and match[0] != code_key:
+                fallbacks[code_key] = match[0]
+                fuzzy[code_key] = match
+                continue
+            alias = resolve_alias(code_str)
+            if alias and alias != code_key:
+                fallbacks[code_key] = alias
+    if fallbacks:
+        fallback_docs = get_many(list(set(fallbacks.values())))
+        for code_key, key in fallbacks.items():
+            docs[code_key] = fallback_docs.get(key)
+            if code_key in fuzzy and docs[code_key] is not None and matches is not None:
+                matches[code_key] = fuzzy[code_key]
+    return docs
+
+
+# Applies the database record (or None) and the label context to one
+# ingredient. match is the (key, confidence) of a fuzzy resolution, if any.
+def evaluate_ingredient(code_str, context, data, match=None):
+    current_status = "Unknown"
+    description = "Not in database yet."
+    name = code_str
+
+    if data is not None:
+        name = data.get('name', name)
+        current_status = data.get('status', 'Unknown')
+        description = data.get('description', '')
+
+    if current_status != "Haram":
+        if has_safe_keyword(context, name):
+            if current_status in ["Syubhah", "Unknown"]:
+                current_status = "Halal"
+                if description == "Not in database yet.":
+                    description = "Verified as Safe by AI Context."
+                elif "(Verified as Safe by AI Context)" not in description:
+                    description += " (Verified as Safe by AI Context)"
+
+    result = {"code": code_str, "name": name, "status": current_status,
+              "description": description, "context": context}
+    if match is not None and data is not None:
+        result["match"] = {"key": match[0], "confidence": round(match[1], 2)}
+        result["description"] += f" (Closest match for \"{code_str}\", {match[1]:.0%} confidence)"
+    return result
+
+
+def combine_status(overall_status, current_status):
+    if current_status == 'Haram':
+        return "Haram"
+    if current_status == 'Syubhah' and overall_status != "Haram":
+        return "Syubhah"
+    return overall_status
+
+
+# check_database without the UI: get_many(keys) -> {key: data} is the lookup
+# verdict_cache (see verdict_cache.py) shares finished verdicts between
+# labels with the same ingredient set; results then come back already sorted.
+def check_ingredients(ingredients, get_many, verdict_cache=None):
+    results_list = []
+    overall_status = "Halal"
+
+    # Pass 1: normalize and dedupe every code before touching the database
+    entries = collect_entries(ingredients)
+    get_many = METRICS.timed("db_lookup", get_many)
+
+    verdict_key = verdict_cache.key_for(entries) if verdict_cache is not None else None
+    if verdict_key is not None:
+        cached = verdict_cache.get(verdict_key)
+        if cached is not None:
+            METRICS.inc("verdict_cache_hits")
+            # Same set, but show this label's own spelling of each code
+            written = {code_key: (code_str, context) for code_key, code_str, context in entries}
+            overall_status, keyed_results = cached
+            return overall_status, [dict(result, code=written[code_key][0], context=written[code_key][1])
+                                    for code_key, result in keyed_results]
+
+    # Pass 2: one batched lookup for all codes, then apply the status logic
+    matches = {}
+    docs = resolve_entries(entries, get_many, matches)
+
+    keyed_results = []
+    for code_key, code_str, context in entries:
+        result = evaluate_ingredient(code_str, context, docs.get(code_key), matches.get(code_key))
+        results_list.append(result)
+        keyed_results.append((code_key, result))
+        overall_status = combine_status(overall_status, result["status"])
+
+    if verdict_key is not None:
+        keyed_results.sort(key=lambda kr: SORT_PRIORITY.get(kr[1]["status"], 5))
+        verdict_cache.put(verdict_key, (overall_status, [(k, dict(r)) for k, r in keyed_results]))
+    return overall_status, results_list
+
+
+def safety_score(details):
+    total_items = len(details)
+    safe_items = sum(1 for i in details if i["status"] == "Halal")
+    return int((safe_items / total_items) * 100) if total_items > 0 else 0
+
+
+# --- HEADLESS SCAN ---
+# The whole photo -> verdict pipeline with no UI: cache check, preprocessing,
+# Gemini (inside gemini_slots, e.g. a semaphore, when given) and the database
+# check. Returns (detected, status, details); Gemini errors propagate.
+def scan_label(image_bytes, model, get_many, scan_cache=None, gemini_slots=None, max_edge=MAX_EDGE,
+               verdict_cache=None):
+    cache_key = ScanCache.make_key(image_bytes, PROMPT_VERSION)
+    detected = scan_cache.get(cache_key) if scan_cache is not None else None
+
+    if detected is None:
+        with METRICS.span("image_decode"):
+            image = decode_image(image_bytes)
+        with METRICS.span("preprocess"):
+            blob, _, _ = prepare_image(image, len(image_bytes), max_edge=max_edge)
+        with gemini_slots or nullcontext():
+            with METRICS.span("gemini"):
+                detected = extract_ingredients(model, blob)
+        if scan_cache is not None:
+            scan_cache.put(cache_key, detected)
+    else:
+        METRICS.inc("scan_cache_hits")
+
+    with METRICS.span("check_database"):
+        status, details = check_ingredients(detected, get_many, verdict_cache)
+        details.sort(key=lambda x: SORT_PRIORITY.get(x["status"], 5))
+    METRICS.inc("scans")
+    return detected, status, details
+
+
+# --- MULTI-PANEL SCAN ---
+# scan_label for several photos of one product: up to MAX_PANELS photos go
+# to Gemini in a single request (side by side on one canvas when tile is
+# set), and the ingredient lists are merged into one verdict. Cached under
+# the hashes of all the photos, in order.
+def panels_cache_key(panel_bytes, tile=False):
+    digest = b"".join(hashlib.sha256(data).digest() for data in panel_bytes)
+    return ScanCache.make_key(digest, f"{PROMPT_VERSION}-panels{'-tiled' if tile else ''}")
+
+
+def scan_panels(panel_bytes, model, get_many, scan_cache=None, gemini_slots=None, max_edge=MAX_EDGE,
+                verdict_cache=None, tile=False):
+    cache_key = panels_cache_key(panel_bytes, tile)
+    detected = scan_cache.get(cache_key) if scan_cache is not None else None
+
+    if detected is None:
+        lists = []
+        for start in range(0, len(panel_bytes), MAX_PANELS):
+            group = panel_bytes[start:start + MAX_PANELS]
+            with METRICS.span("image_decode"):
+                images = [decode_image(data) for data in group]
+            with METRICS.span("preprocess"):
+                if tile:
+                    blobs = [prepare_image(tile_images(images, max_edge), max_edge=max_edge, crop_text=False)[0]]
+                else:
+                    blobs = [prepare_image(image, len(data), max_edge=max_edge)[0] for image, data in zip(images, group)]
+            with gemini_slots or nullcontext():
+                with METRICS.span("gemini"):
+                    lists.append(extract_panels(model, blobs, len(group), tiled=tile))
+        detected = merge_ingredients(lists)
+        METRICS.inc("gemini_calls_saved", len(panel_bytes) - len(lists))
+        if scan_cache is not None:
+            scan_cache.put(cache_key, detected)
+    else:
+        METRICS.inc("scan_cache_hits")
+
+    with METRICS.span("check_database"):
+        status, details = check_ingredients(detected, get_many, verdict_cache)
+        details.sort(key=lambda x: SORT_PRIORITY.get(x["status"], 5))
+    METRICS.inc("scans")
+    return detected, status, details
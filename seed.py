@@ -1,13 +1,11 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import hashlib
+import json
+import time
 
-# 1. Setup Firebase
-# We use the key file you just downloaded
-cred = credentials.Certificate("firebase_key.json")
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+from ecode_cache import ECODES_COLLECTION
+from ecode_index import INDEX_PATH, VERSION_COLLECTION, VERSION_DOC, data_version, fetch_remote_version, write_index
 
-# 2. The Truth List (Data to upload)
+# 1. The Truth List (Data to upload)
 # I have pre-filled this with common Malaysian E-codes
 ecodes_data = {
     # --- COLORS (E100-E199) ---
@@ -220,12 +218,100 @@ ecodes_data = {
     "E960": {"code": "E960", "name": "Steviol Glycosides (Stevia)", "status": "Halal", "source": "Plant", "description": "Natural sweetener."}
 }
 
-# 3. Upload to Firestore
-print("🚀 Connecting to Firebase...")
-collection = db.collection('ecodes')
+# 2. Sync to Firestore
+# Only runs as a script, so other modules can import ecodes_data.
+# Reads the live collection once, compares content hashes with the table
+# above and writes only what changed, in batches. Re-running with unchanged
+# data costs one collection read and no writes.
+BATCH_LIMIT = 500  # Firestore's maximum operations per batch
 
-for code, data in ecodes_data.items():
-    collection.document(code).set(data)
-    print(f"✅ Uploaded: {code} ({data['status']})")
 
-print("\n🎉 Database Populated Successfully!")
\ No newline at end of file
+def content_hash(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+# remote: {doc_id: data} as currently stored. Returns (adds, updates, deletes)
+# as sorted lists of doc ids.
+def diff_ecodes(remote, local):
+    adds = sorted(k for k in local if k not in remote)
+    updates = sorted(k for k in local if k in remote and content_hash(local[k]) != content_hash(remote[k]))
+    deletes = sorted(k for k in remote if k not in local)
+    return adds, updates, deletes
+
+
+def apply_changes(db, collection, local, adds, updates, deletes, batch_limit=BATCH_LIMIT):
+    ops = [("set", k) for k in adds + updates] + [("delete", k) for k in deletes]
+    batches = 0
+    for start in range(0, len(ops), batch_limit):
+        batch = db.batch()
+        for op, key in ops[start:start + batch_limit]:
+            if op == "set":
+                batch.set(collection.document(key), local[key])
+            else:
+                batch.delete(collection.document(key))
+        batch.commit()
+        batches += 1
+    return batches
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sync ecodes_data to the Firestore ecodes collection.")
+    parser.add_argument("--dry-run", action="store_true", help="report the changes without writing")
+    parser.add_argument("--keep-extra", action="store_true",
+                        help="do not delete documents that are missing from ecodes_data")
+    args = parser.parse_args()
+
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
+    # We use the key file you just downloaded
+    cred = credentials.Certificate("firebase_key.json")
+    firebase_admin.initialize_app(cred)
+    db = firestore.client()
+
+    print("🚀 Connecting to Firebase...")
+    collection = db.collection(ECODES_COLLECTION)
+
+    started = time.perf_counter()
+    remote = {doc.id: doc.to_dict() for doc in collection.stream()}
+    read_s = time.perf_counter() - started
+
+    adds, updates, deletes = diff_ecodes(remote, ecodes_data)
+    if args.keep_extra:
+        deletes = []
+
+    # What the collection holds after the sync, and the version stamp for it
+    synced = {k: v for k, v in remote.items() if k not in deletes}
+    synced.update(ecodes_data)
+    version = data_version(synced)
+    stamp_changed = fetch_remote_version(db) != version
+
+    for label, keys in (("➕ Add", adds), ("✏️ Update", updates), ("🗑️ Delete", deletes)):
+        for key in keys:
+            print(f"{label}: {key}")
+    print(f"\n{len(remote)} in Firestore, {len(ecodes_data)} local: {len(adds)} to add, "
+          f"{len(updates)} to update, {len(deletes)} to delete (read in {read_s:.2f}s)")
+
+    if args.dry_run:
+        print(f"Dry run: nothing written. Data version would be {version}.")
+        return
+
+    if adds or updates or deletes:
+        started = time.perf_counter()
+        batches = apply_changes(db, collection, ecodes_data, adds, updates, deletes)
+        print(f"\n🎉 Database synced: {len(adds) + len(updates) + len(deletes)} writes "
+              f"in {batches} batch(es), {time.perf_counter() - started:.2f}s")
+    else:
+        print("\n🎉 Database already up to date!")
+
+    # Apps compare this stamp with their embedded index to decide when to reload
+    if stamp_changed:
+        db.collection(VERSION_COLLECTION).document(VERSION_DOC).set({"version": version})
+        print(f"📌 Data version: {version}")
+    write_index(INDEX_PATH, synced, version)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+IDLE_TIMEOUT = 20 * 60        # seconds without a rerun before a session's data is dropped
+MAX_SESSIONS = 1000           # sessions holding data before the least recently active is dropped
+SESSION_BUDGET = 4_000_000    # approximate bytes one session may hold
+MAX_TOTAL_BYTES = 400_000_000 # approximate bytes all sessions together may hold
+SWEEP_INTERVAL = 60           # seconds between idle sweeps
+EVICTED_MEMORY = 5000         # dropped session ids remembered, so the user can be told
+
+RESULT_FIELDS = ("code", "name", "status", "description", "context")
+
+
+# --- COMPACT RESULTS ---
+# A verdict as tuples instead of one dict per ingredient, with interned
+# strings so the same database description is held once for all sessions.
+# expand_results() gives back the {"status", "details", ...} dict the UI
+# renders.
+def compact_results(results):
+    rows = []
+    for item in results["details"]:
+        row = tuple(sys.intern(str(item.get(field, ""))) for field in RESULT_FIELDS)
+        match = item.get("match")
+        rows.append(row + ((match["key"], match["confidence"]) if match else None,))
+    compact = {key: value for key, value in results.items() if key != "details"}
+    compact["rows"] = tuple(rows)
+    return compact
+
+
+def expand_results(compact):
+    details = []
+    for row in compact["rows"]:
+        item = dict(zip(RESULT_FIELDS, row))
+        if row[-1] is not None:
+            item["match"] = {"key": row[-1][0], "confidence": row[-1][1]}
+        details.append(item)
+    results = {key: value for key, value in compact.items() if key != "rows"}
+    results["details"] = details
+    return results
+
+
+# Rough byte count of nested str/bytes/tuple/list/dict values, for budgets
+def approx_size(value):
+    if isinstance(value, (str, bytes, bytearray)):
+        return len(value) + 50
+    if isinstance(value, dict):
+        return 230 + sum(approx_size(k) + approx_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 56 + 8 * len(value) + sum(approx_size(v) for v in value)
+    return 28
+
+
+# --- SESSION STORE ---
+# Process-wide home for the bulky per-session data (results, previews,
+# batch output) that would otherwise sit in st.session_state for as long as
+# a browser tab stays open. Every session has a byte budget; sessions idle
+# for IDLE_TIMEOUT, and the least recently active beyond MAX_SESSIONS or
+# while the store is over max_bytes, are dropped whole. touch() tells a
+# returning session whether that happened.
+class SessionStore:
+    def __init__(self, idle_timeout=IDLE_TIMEOUT, max_sessions=MAX_SESSIONS, budget=SESSION_BUDGET,
+                 max_bytes=MAX_TOTAL_BYTES):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.budget = budget
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.rejected = 0
+        self._bytes = 0
+        self._sessions = OrderedDict()  # id -> {"seen": t, "values": {name: (size, value)}}
+        self._evicted = OrderedDict()
+        self._last_sweep = time.monotonic()
+        self._lock = threading.Lock()
+
+    # Marks the session active; True if its data was dropped while it was away
+    def touch(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session["seen"] = now
+                self._sessions.move_to_end(session_id)
+            evicted = self._evicted.pop(session_id, None) is not None
+            if now - self._last_sweep >= SWEEP_INTERVAL:
+                self._sweep(now)
+            return evicted
+
+    def get(self, session_id, name, default=None):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or name not in session["values"]:
+                return default
+            return session["values"][name][1]
+
+    # Stores value (None deletes). Older values of the same session make room
+    # first; returns False if the value alone is over the budget.
+    def set(self, session_id, name, value):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if value is None:
+                if session is not None:
+                    self._discard(session, name)
+                return True
+            size = approx_size(value)
+            if size > self.budget:
+                self.rejected += 1
+                if session is not None:
+                    self._discard(session, name)
+                return False
+            if session is None:
+                session = self._sessions[session_id] = {"seen": time.monotonic(), "values": {}}
+            values = session["values"]
+            self._discard(session, name)
+            while values and sum(s for s, _ in values.values()) + size > self.budget:
+                self._discard(session, next(iter(values)))
+            values[name] = (size, value)
+            self._bytes += size
+            self._sessions.move_to_end(session_id)
+            # The session just written is the most recent, so it goes last
+            while len(self._sessions) > self.max_sessions or (self._bytes > self.max_bytes
+                                                               and len(self._sessions) > 1):
+                self._drop(next(iter(self._sessions)))
+            return True
+
+    def _discard(self, session, name):
+        entry = session["values"].pop(name, None)
+        if entry is not None:
+            self._bytes -= entry[0]
+
+    def _drop(self, session_id):
+        session = self._sessions.pop(session_id)
+        self._bytes -= sum(size for size, _ in session["values"].values())
+        self._evicted[session_id] = True
+        while len(self._evicted) > EVICTED_MEMORY:
+            self._evicted.popitem(last=False)
+        self.evictions += 1
+
+    def _sweep(self, now):
+        self._last_sweep = now
+        for session_id in [sid for sid, s in self._sessions.items() if now - s["seen"] >= self.idle_timeout]:
+            self._drop(session_id)
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._sessions), "evictions": self.evictions, "rejected": self.rejected,
+                    "approx_bytes": self._bytes, "max_bytes": self.max_bytes}
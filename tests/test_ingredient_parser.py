@@ -0,0 +1,36 @@
+import pytest
+
+from ingredient_parser import parse_ingredient_text
+from scanner import CODE_INDEX
+from seed import ecodes_data
+
+KNOWN_KEYS = set(ecodes_data) | CODE_INDEX.keys()
+
+
+def codes(text):
+    return [item["code"] for item in parse_ingredient_text(text, KNOWN_KEYS)]
+
+
+# --- CODES ---
+@pytest.mark.parametrize("text, code, context", [
+    ("Sugar, Colour: 120, Salt", "E120", "Colour"),
+    ("Emulsifier 471, Sugar", "E471", "Emulsifier"),
+    ("Emulsifier: 471(i), Salt", "E471(i)", "Emulsifier"),
+    ("Emulsifiers (471, 322)", "E471", "Emulsifiers"),
+])
+def test_class_name_then_ins_number(text, code, context):
+    items = parse_ingredient_text(text, KNOWN_KEYS)
+    assert {"code": code, "context": context} in items
+
+
+# --- NAMES ---
+@pytest.mark.parametrize("text, expected", [
+    ("Soy Lecithin", ["Lecithin"]),
+    ("Pork Gelatin", ["Pork"]),
+    ("Beef Gelatin Powder", ["Gelatin"]),
+    ("Cocoa Butter", ["Cocoa Butter"]),
+    ("Soy Sauce", ["Soy Sauce"]),
+    ("Wheat Flour, Chocolate Chips", ["Wheat Flour", "Chocolate Chips"]),
+])
+def test_name_matching(text, expected):
+    assert codes(text) == expected
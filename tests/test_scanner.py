@@ -0,0 +1,73 @@
+import pytest
+
+from scanner import CODE_INDEX, check_ingredients, fuzzy_match, normalize_code, resolve_alias
+from seed import ecodes_data
+
+
+def get_many(keys):
+    return {key: ecodes_data.get(key) for key in keys}
+
+
+# --- ALIASES ---
+@pytest.mark.parametrize("text, key", [
+    ("Pork Gelatin", "PORK"),
+    ("Pork Gelatine", "PORK"),
+    ("Gelatin (Pork)", "PORK"),
+    ("Beef Gelatin", "E441"),
+    ("Soy Lecithin", "E322"),
+    ("Emulsifier Soy Lecithin", "E322"),
+    ("Wheat Flour", "FLOUR"),
+    ("pork-free gelatin", "E441"),
+])
+def test_resolve_alias(text, key):
+    assert resolve_alias(text) == key
+
+
+# A Halal alias inside a longer name is a different ingredient
+@pytest.mark.parametrize("text", ["Soy sauce", "Cocoa Butter", "Sunflower Oil", "Rice Flour", "non-dairy creamer"])
+def test_resolve_alias_partial_halal_is_unknown(text):
+    assert resolve_alias(text) is None
+
+
+def test_haram_alias_wins_over_position():
+    status, details = check_ingredients([{"code": "471"}, {"code": "Pork Gelatin"}], get_many)
+    assert status == "Haram"
+    assert {d["status"] for d in details} == {"Syubhah", "Haram"}
+
+
+# --- CODE NORMALIZER ---
+@pytest.mark.parametrize("text, key", [
+    ("Carmine", "CARMINE"),
+    ("Cochineal", "COCHINEAL"),
+    ("Ethanol", "ALCOHOL"),
+    ("E 471 (i)", "E471"),
+])
+def test_normalize_code(text, key):
+    assert normalize_code(text) == key
+
+
+# A tight slash is one name: neither half is a spelling of its own
+def test_tight_slash_is_one_name():
+    assert "SODIUM" not in CODE_INDEX
+    assert "POTASSIUM" not in CODE_INDEX
+
+
+# --- FUZZY FALLBACK ---
+@pytest.mark.parametrize("text, key", [
+    ("Gelatine", "GELATIN"),
+    ("Carmin", "CARMINE"),
+    ("Gelatln", "GELATIN"),
+    ("E47l", "E471"),
+    ("Sodium Benzoat", "E211"),
+    ("Mono and Diglyceride", "E471"),
+])
+def test_fuzzy_match_near_misses(text, key):
+    assert fuzzy_match(text)[0] == key
+
+
+# Close spellings of different ingredients stay Unknown
+@pytest.mark.parametrize("text", ["Sodium caseinate", "Insulin"])
+def test_fuzzy_match_keeps_other_ingredients_unknown(text):
+    assert fuzzy_match(text) is None
+    _, details = check_ingredients([{"code": text}], get_many)
+    assert details[0]["status"] == "Unknown"
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+MAX_ENTRIES = 2048  # verdicts kept before LRU eviction
+TTL = 6 * 3600      # seconds a verdict is trusted, whatever the data version says
+
+
+# --- INGREDIENT-SET VERDICT CACHE ---
+# Memoizes check_ingredients by a fingerprint of the normalized (code,
+# context) set, so different photos of the same product share one verdict.
+# The ecodes data version is part of the key: once the table changes, old
+# verdicts are never served again and age out of the LRU.
+#
+# data_version is a callable returning the current version, or None when it
+# is unknown (e.g. the E-code table could not be loaded); nothing is cached
+# then.
+class VerdictCache:
+    def __init__(self, data_version, max_entries=MAX_ENTRIES, ttl=TTL):
+        self.data_version = data_version
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # entries: (code_key, code_str, context) from collect_entries. Order,
+    # case and spacing of the label text do not change the fingerprint.
+    @staticmethod
+    def make_key(entries, data_version):
+        canonical = sorted((code_key, " ".join(context.lower().split())) for code_key, _, context in entries)
+        digest = hashlib.sha256(json.dumps(canonical, ensure_ascii=False).encode()).hexdigest()
+        return f"{data_version}-{digest}"
+
+    def key_for(self, entries):
+        version = self.data_version()
+        return None if version is None else self.make_key(entries, version)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }